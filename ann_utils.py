@@ -0,0 +1,185 @@
+# ann_utils.py
+import math
+import time
+import numpy as np
+import faiss
+from config import ANN_INDEX_TYPE, ANN_FLAT_MAX_VECTORS, ANN_HNSW_MAX_VECTORS, ANN_RECALL_TARGET
+
+INDEX_TYPES = ["flat", "hnsw", "ivf", "ivfpq", "sq8"]
+# Search-time knob tuned per index type, and the values tried in order (cheapest first)
+SEARCH_PARAMS = {"hnsw": ("efSearch", [16, 32, 64, 128, 256, 512, 1024])}
+TUNE_QUERIES = 200
+TUNE_K = 10
+PQ_MAX_RECALL_TARGET = 0.75
+
+
+def index_kind(index):
+    """Map a faiss index back to one of INDEX_TYPES."""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        ivf = faiss.downcast_index(faiss.extract_index_ivf(index))
+        if isinstance(ivf, faiss.IndexIVFPQ):
+            return "ivfpq"
+        if isinstance(ivf, faiss.IndexIVFScalarQuantizer):
+            return "sq8"
+        return "ivf"
+    return "flat"
+
+
+def candidate_types(count):
+    """Index types to try for a collection of count vectors, most compact first; the first to reach the recall target wins.
+    Small collections stay flat even when ANN_INDEX_TYPE pins a type, since there is too little data to train on."""
+    if ANN_INDEX_TYPE != "auto" and ANN_INDEX_TYPE not in INDEX_TYPES:
+        raise ValueError(f"Unsupported ANN_INDEX_TYPE '{ANN_INDEX_TYPE}'. Use 'auto' or one of {INDEX_TYPES}.")
+    if count < ANN_FLAT_MAX_VECTORS:
+        return ["flat"]
+    if ANN_INDEX_TYPE != "auto":
+        return [ANN_INDEX_TYPE]
+    if count < ANN_HNSW_MAX_VECTORS:
+        return ["hnsw", "ivf"]
+    # PQ's quantization error caps recall@10 around 0.7-0.8 without re-ranking (see benchmarks/bench_ann.py), so
+    # its slow training is only worth trying when the target allows it
+    if ANN_RECALL_TARGET <= PQ_MAX_RECALL_TARGET:
+        return ["ivfpq", "sq8"]
+    return ["sq8"]
+
+
+def _nlist(count):
+    # ~4 * sqrt(n) lists, but never fewer than ~40 training points per list
+    return max(1, min(65536, count // 40, int(4 * math.sqrt(count))))
+
+
+def _pq_subquantizers(d):
+    # One byte per ~4 dimensions (16x smaller than float32); m must divide d
+    return next(m for m in range(max(1, d // 4), 0, -1) if d % m == 0)
+
+
+def factory_string(kind, count, d):
+    if kind == "flat":
+        return "Flat"
+    if kind == "hnsw":
+        return "HNSW32"
+    nlist = _nlist(count)
+    if kind == "ivf":
+        return f"IVF{nlist},Flat"
+    if kind == "ivfpq":
+        return f"IVF{nlist},PQ{_pq_subquantizers(d)}"
+    if kind == "sq8":
+        return f"IVF{nlist},SQ8"
+    raise ValueError(f"Unknown index type '{kind}'.")
+
+
+def bytes_per_vector(index):
+    """Approximate resident bytes per stored vector, for the vectorstore cache budget."""
+    kind = index_kind(index)
+    if kind == "hnsw":
+        # Full vectors plus the level-0 neighbor list (upper levels hold few nodes)
+        return index.d * 4 + faiss.downcast_index(index).hnsw.nb_neighbors(0) * 4
+    if kind == "ivf":
+        return index.d * 4 + 8
+    if kind == "sq8":
+        return index.d + 8
+    if kind == "ivfpq":
+        return faiss.downcast_index(faiss.extract_index_ivf(index)).pq.code_size + 8
+    return index.d * 4
+
+
+def search_param(index):
+    """(name, candidate values) of the knob trading latency for recall, or None for exact indexes."""
+    kind = index_kind(index)
+    if kind in SEARCH_PARAMS:
+        return SEARCH_PARAMS[kind]
+    if kind != "flat":
+        nlist = faiss.extract_index_ivf(index).nlist
+        return "nprobe", [p for p in (1, 2, 4, 8, 16, 32, 64, 128, 256, 512) if p < nlist] + [nlist]
+    return None
+
+
+def set_search_param(index, name, value):
+    faiss.ParameterSpace().set_index_parameter(index, name, value)
+
+
+def build_index(kind, vectors, metric=faiss.METRIC_L2):
+    """Train (if needed) and fill an index of the given type. vectors is a float32 (n, d) array."""
+    count, d = vectors.shape
+    index = faiss.index_factory(d, factory_string(kind, count, d), metric)
+    if not index.is_trained:
+        # k-means wants ~40+ points per centroid; a bounded sample keeps training time flat for huge collections
+        nlist = faiss.extract_index_ivf(index).nlist
+        sample = vectors
+        if count > 64 * nlist:
+            sample = vectors[np.random.default_rng(0).choice(count, 64 * nlist, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    return index
+
+
+def exact_neighbors(vectors, queries, k=TUNE_K, metric=faiss.METRIC_L2):
+    exact = faiss.IndexFlat(vectors.shape[1], metric)
+    exact.add(vectors)
+    return exact.search(queries, k)[1]
+
+
+def recall_at_k(index, queries, truth, k=TUNE_K):
+    found = index.search(queries, k)[1]
+    hits = sum(len(set(row[row >= 0]) & set(expected)) for row, expected in zip(found, truth))
+    return hits / truth.size
+
+
+def tune_index(index, queries, truth, target=ANN_RECALL_TARGET):
+    """Set the cheapest search parameter reaching the target recall@k; returns {"param", "value", "recall", "query_ms"}."""
+    knob = search_param(index)
+    if knob is None:
+        return {"param": None, "value": None, "recall": 1.0, "query_ms": None}
+    name, values = knob
+    result = None
+    for value in values:
+        set_search_param(index, name, value)
+        start = time.perf_counter()
+        recall = recall_at_k(index, queries, truth)
+        query_ms = 1000 * (time.perf_counter() - start) / len(queries)
+        # Stop once widening the search no longer helps, e.g. when quantization error caps PQ recall
+        plateaued = result is not None and recall - result["recall"] < 0.002
+        if plateaued:
+            set_search_param(index, name, result["value"])
+            break
+        result = {"param": name, "value": value, "recall": recall, "query_ms": query_ms}
+        if recall >= target:
+            break
+    return result
+
+
+def tuning_queries(vectors, count=TUNE_QUERIES):
+    rng = np.random.default_rng(1)
+    return vectors[rng.choice(len(vectors), min(count, len(vectors)), replace=False)]
+
+
+def build_adaptive_index(vectors, metric=faiss.METRIC_L2, target=ANN_RECALL_TARGET):
+    """Build the most compact candidate type for this many vectors that reaches the recall target (the last
+    candidate otherwise) and tune its search parameter. Returns (index, kind, tuning)."""
+    kinds = candidate_types(len(vectors))
+    if kinds == ["flat"]:
+        return build_index("flat", vectors, metric), "flat", {"param": None, "value": None, "recall": 1.0, "query_ms": None}
+    queries = tuning_queries(vectors)
+    truth = exact_neighbors(vectors, queries, metric=metric)
+    for kind in kinds:
+        index = build_index(kind, vectors, metric)
+        tuning = tune_index(index, queries, truth, target)
+        print(f"Debug: {kind} index over {len(vectors)} vectors: recall@{TUNE_K} {tuning['recall']:.3f} "
+              f"with {tuning['param']}={tuning['value']}")
+        if tuning["recall"] >= target:
+            break
+    return index, kind, tuning
+
+
+def index_vectors(index, start=0, end=None):
+    """Reconstruct stored vectors [start, end) from any index type. Lossy for PQ and SQ8."""
+    end = index.ntotal if end is None else end
+    if end <= start:
+        return np.zeros((0, index.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # IVF lists are unordered; reconstructing by position needs the id -> list map
+        ivf.make_direct_map()
+    return index.reconstruct_n(start, end - start)
@@ -1,31 +1,95 @@
 # augment_utils.py
-import spacy
 import requests
 import re
+import time
+import hashlib
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import MODEL_NAME, OLLAMA_URL, AUGMENT_MAX_WORKERS, AUGMENT_MAX_RETRIES, AUGMENT_TIMEOUT
+from utils import hash_chunk, get_connection
+from db_utils import _chunked_in_query
 
-nlp = spacy.load("en_core_web_sm")
+
+# Prompt templates; {chunk} is replaced with the chunk text. The template is part of the cache key.
+CORRECTION_PROMPT = "Correct spelling and grammar in this content chunk without changing any words, meaning, or structure: {chunk}. Include only the corrected text, do not add or remove anything else."
+ENHANCE_PROMPT = "Enhance and correct this content chunk for clarity and accuracy: {chunk}. Include only the corrected text, do not include a summarization of the changes."
+TRANSCRIPT_PROMPT = "Enhance and correct this transcript chunk for clarity and accuracy: {chunk}. Include only the corrected text, do not include a summarization of the changes."
+
+# Shared by every caller: ingestion cleans several documents at once, each with its own pool of chunk requests,
+# and Ollama should still see at most AUGMENT_MAX_WORKERS of them
+_ollama_slots = threading.BoundedSemaphore(AUGMENT_MAX_WORKERS)
+
+def _cache_key(model, template, chunk):
+    return hashlib.sha256(f"{model}\0{template}\0{hash_chunk(chunk)}".encode()).hexdigest()
+
+def _load_cached(keys):
+    return dict(_chunked_in_query(get_connection(), "SELECT key, response FROM augment_cache WHERE key IN ({placeholders})", keys))
+
+def _store_cached(key, model, response):
+    conn = get_connection()
+    conn.execute("INSERT OR REPLACE INTO augment_cache (key, model, response, created) VALUES (?, ?, ?, ?)",
+                 (key, model, response, datetime.now().isoformat()))
+    conn.commit()
+
+def _generate(prompt, model):
+    """Call Ollama with retries and exponential backoff. Returns None once retries are exhausted."""
+    payload = {"model": model, "prompt": prompt, "stream": False}
+    for attempt in range(AUGMENT_MAX_RETRIES + 1):
+        try:
+            with _ollama_slots:
+                response = requests.post(f"{OLLAMA_URL}/api/generate", json=payload, timeout=AUGMENT_TIMEOUT)
+            if response.status_code == 200:
+                return response.json()['response'].strip()
+            print(f"Error augmenting chunk with Ollama (attempt {attempt + 1}): {response.text}")
+        except requests.exceptions.RequestException as e:
+            print(f"Ollama request failed (attempt {attempt + 1}): {e}")
+        if attempt < AUGMENT_MAX_RETRIES:
+            time.sleep(2 ** attempt)
+    return None
+
+def iter_augmented_chunks(chunks, template=CORRECTION_PROMPT, model=MODEL_NAME, progress=None):
+    """
+    Augment chunks with bounded concurrent Ollama requests, reusing cached results keyed by (model, template, chunk hash).
+    Yields (index, text, origin) as each chunk finishes, where origin is 'cache', 'ollama' or 'fallback'
+    (Ollama failed and the original chunk is returned unchanged). progress(message), if given, is called per generated chunk.
+    """
+    keys = [_cache_key(model, template, chunk) for chunk in chunks]
+    cached = _load_cached(list(set(keys)))
+    pending = []
+    for i, key in enumerate(keys):
+        if key in cached:
+            yield i, cached[key], 'cache'
+        else:
+            pending.append(i)
+    print(f"Debug: Augmenting {len(chunks)} chunks: {len(chunks) - len(pending)} cached, {len(pending)} to generate.")
+    if not pending:
+        return
+    with ThreadPoolExecutor(max_workers=min(AUGMENT_MAX_WORKERS, len(pending))) as executor:
+        futures = {executor.submit(_generate, template.format(chunk=chunks[i]), model): i for i in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            text = future.result()
+            if text is not None:
+                _store_cached(keys[i], model, text)
+            if progress:
+                progress(f"Augmented {done}/{len(pending)} chunks with Ollama"
+                         + (f" ({len(chunks) - len(pending)} cached)" if len(pending) < len(chunks) else ""))
+            if text is None:
+                yield i, chunks[i], 'fallback'
+            else:
+                yield i, text, 'ollama'
+
+def augment_chunks(chunks, template=CORRECTION_PROMPT, model=MODEL_NAME, progress=None):
+    """Augment all chunks and return the results in input order."""
+    results = list(chunks)
+    for i, text, _ in iter_augmented_chunks(chunks, template=template, model=model, progress=progress):
+        results[i] = text
+    return results
 
 def augment_chunk(chunk):
     """
     Enhance the chunk with Ollama for spelling and grammar correction only, without changing words, meaning, or structure.
     Returns the corrected text.
     """
-    print("Debug: Starting Ollama correction...")
-    ollama_url = "http://localhost:11434/api/generate"
-    payload = {
-        "model": "qwen2.5:7b",
-        "prompt": f"Correct spelling and grammar in this content chunk without changing any words, meaning, or structure: {chunk}. Include only the corrected text, do not add or remove anything else.",
-        "stream": False
-    }
-    try:
-        response = requests.post(ollama_url, json=payload, timeout=30)
-        if response.status_code == 200:
-            enhanced_text = response.json()['response'].strip()
-            print(f"Debug: Ollama correction successful. Corrected text length: {len(enhanced_text)}")
-            return enhanced_text
-        else:
-            print(f"Error correcting chunk with Ollama: {response.text}")
-            return chunk  # Fallback to original
-    except requests.exceptions.RequestException as e:
-        print(f"Ollama request failed: {e}. Falling back to original text.")
-        return chunk
\ No newline at end of file
+    return augment_chunks([chunk])[0]
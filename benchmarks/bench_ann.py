@@ -0,0 +1,79 @@
+# benchmarks/bench_ann.py
+# Recall@10 and per-query latency of every ANN index type against the exact flat baseline, on the saved collections
+# and optionally a synthetic one. Usage: python benchmarks/bench_ann.py [--min-vectors 100] [--synthetic 200000]
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import faiss
+from config import FAISS_PATH, ANN_RECALL_TARGET
+from vectorstore_manager import collection_index_path
+from ann_utils import (INDEX_TYPES, TUNE_K, build_index, exact_neighbors, index_vectors, tuning_queries, tune_index,
+                       bytes_per_vector, candidate_types)
+
+
+def saved_collections(min_vectors):
+    for tag in sorted(os.listdir(FAISS_PATH)):
+        path = collection_index_path(os.path.join(FAISS_PATH, tag))
+        if os.path.exists(path):
+            index = faiss.read_index(path)
+            if index.ntotal >= min_vectors:
+                yield tag, index_vectors(index), index.metric_type
+
+
+def synthetic_collection(count, d=384, clusters=1000, seed=0):
+    """Normalized vectors around random topic centroids, like sentence embeddings of crawled pages."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(clusters, d)).astype(np.float32)
+    vectors = centroids[rng.integers(0, clusters, count)] + 0.5 * rng.normal(size=(count, d)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def flat_query_ms(vectors, queries, metric):
+    index = build_index("flat", vectors, metric)
+    start = time.perf_counter()
+    index.search(queries, TUNE_K)
+    return 1000 * (time.perf_counter() - start) / len(queries)
+
+
+def bench_collection(name, vectors, metric, target):
+    queries = tuning_queries(vectors)
+    truth = exact_neighbors(vectors, queries, metric=metric)
+    baseline_ms = flat_query_ms(vectors, queries, metric)
+    print(f"\n{name}: {len(vectors)} vectors, {vectors.shape[1]} dims; auto picks from {candidate_types(len(vectors))}")
+    print(f"{'type':<7} {'build s':>8} {'param':>14} {'recall@10':>10} {'ms/query':>9} {'vs flat':>8} {'bytes/vec':>10}")
+    for kind in INDEX_TYPES:
+        start = time.perf_counter()
+        try:
+            index = build_index(kind, vectors, metric)
+        except RuntimeError as e:
+            print(f"{kind:<7} {'failed':>8}  {str(e).splitlines()[0][:70]}")
+            continue
+        build_s = time.perf_counter() - start
+        tuning = tune_index(index, queries, truth, target)
+        query_ms = tuning["query_ms"] if tuning["query_ms"] is not None else baseline_ms
+        param = f"{tuning['param']}={tuning['value']}" if tuning["param"] else "-"
+        print(f"{kind:<7} {build_s:>8.2f} {param:>14} {tuning['recall']:>10.3f} {query_ms:>9.3f} "
+              f"{baseline_ms / max(query_ms, 1e-9):>7.1f}x {bytes_per_vector(index):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ANN index types against exact search.")
+    parser.add_argument("--min-vectors", type=int, default=100, help="Skip saved collections smaller than this")
+    parser.add_argument("--synthetic", type=int, default=0, help="Also benchmark a synthetic collection of this size")
+    parser.add_argument("--target", type=float, default=ANN_RECALL_TARGET, help="Recall@10 each type is tuned to reach")
+    args = parser.parse_args()
+
+    for tag, vectors, metric in saved_collections(args.min_vectors):
+        bench_collection(tag, vectors, metric, args.target)
+    if args.synthetic:
+        bench_collection(f"synthetic-{args.synthetic}", synthetic_collection(args.synthetic), faiss.METRIC_L2, args.target)
+
+
+if __name__ == "__main__":
+    main()
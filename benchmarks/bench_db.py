@@ -0,0 +1,144 @@
+# benchmarks/bench_db.py
+# Compare the legacy crawled.db layout (one chunks table, no secondary indexes) with the migrated schema on a
+# synthetic database. Usage: python benchmarks/bench_db.py [--chunks 1000000] [--tags 50] [--dir bench_data]
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import connect_db, hash_chunk
+from db_utils import migrate_db, get_unique_tags, get_tag_chunks, search_chunks_bm25, delete_collection
+
+VOCABULARY_SIZE = 5000
+WORDS_PER_CHUNK = 50
+BATCH_SIZE = 50000
+LOOKUPS = 1000
+
+
+def build_legacy_db(path, chunk_count, tag_count, seed=0):
+    """Create the schema the app had before versioned migrations and fill it with synthetic chunks."""
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(VOCABULARY_SIZE)]
+    conn = connect_db(path)
+    c = conn.cursor()
+    c.execute("CREATE TABLE urls (url TEXT PRIMARY KEY, timestamp DATETIME, cleaned_text TEXT)")
+    c.execute("CREATE TABLE chunks (hash TEXT PRIMARY KEY, content TEXT, source TEXT, tag TEXT, metadata TEXT)")
+    c.execute("CREATE TABLE collections (name TEXT PRIMARY KEY, tag TEXT)")
+    c.execute("CREATE VIRTUAL TABLE chunks_fts USING fts5(content, hash UNINDEXED, source UNINDEXED, tag UNINDEXED)")
+    c.executemany("INSERT INTO collections (name, tag) VALUES (?, ?)",
+                  [(f"Bench {i}", f"__bench_{i}") for i in range(tag_count)])
+    hashes = []
+    for start in range(0, chunk_count, BATCH_SIZE):
+        rows = []
+        for i in range(start, min(start + BATCH_SIZE, chunk_count)):
+            content = f"chunk{i} " + " ".join(rng.choices(vocabulary, k=WORDS_PER_CHUNK))
+            chunk_hash = hash_chunk(content)
+            hashes.append(chunk_hash)
+            # Sources hold ~20 chunks each, like a crawled page
+            rows.append((chunk_hash, content, f"https://example.com/page{i // 20}", f"__bench_{rng.randrange(tag_count)}"))
+        c.executemany("INSERT INTO chunks (hash, content, source, tag) VALUES (?, ?, ?, ?)", rows)
+        c.executemany("INSERT INTO chunks_fts (hash, content, source, tag) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        print(f"Debug: Wrote {min(start + BATCH_SIZE, chunk_count)}/{chunk_count} chunks.")
+    return conn, hashes
+
+
+def timed(label, fn, results):
+    start = time.perf_counter()
+    value = fn()
+    elapsed = time.perf_counter() - start
+    results[label] = elapsed
+    print(f"{label:<40} {elapsed * 1000:>12.1f} ms")
+    return value
+
+
+def legacy_queries(conn, tag, source, hashes):
+    c = conn.cursor()
+    results = {}
+    timed("rows for one tag", lambda: c.execute("SELECT * FROM chunks WHERE tag = ?", (tag,)).fetchall(), results)
+    timed("distinct tags", lambda: c.execute("SELECT DISTINCT tag FROM chunks WHERE tag IS NOT NULL").fetchall(), results)
+    timed("rows for one source", lambda: c.execute("SELECT * FROM chunks WHERE source = ?", (source,)).fetchall(), results)
+    timed(f"{LOOKUPS} docstore lookups by hash", lambda: [
+        c.execute("SELECT content, source, tag, metadata FROM chunks WHERE hash = ?", (h,)).fetchone() for h in hashes], results)
+    timed("bm25 top-5 in one tag", lambda: c.execute(
+        "SELECT content, source, tag FROM chunks_fts WHERE chunks_fts MATCH ? AND tag = ? ORDER BY bm25(chunks_fts) LIMIT 5",
+        ('"word1" OR "word2"', tag)).fetchall(), results)
+
+    def delete():
+        c.execute("DELETE FROM collections WHERE tag = ?", (tag,))
+        c.execute("DELETE FROM chunks WHERE tag = ?", (tag,))
+        c.execute("DELETE FROM chunks_fts WHERE tag = ?", (tag,))
+        conn.commit()
+    timed("delete one collection", delete, results)
+    return results
+
+
+def migrated_queries(conn, tag, source, hashes):
+    c = conn.cursor()
+    results = {}
+    timed("rows for one tag", lambda: get_tag_chunks(conn, tag), results)
+    timed("distinct tags", lambda: get_unique_tags(conn), results)
+    timed("rows for one source", lambda: c.execute("SELECT * FROM tagged_chunks WHERE source = ?", (source,)).fetchall(), results)
+    timed(f"{LOOKUPS} docstore lookups by hash", lambda: [
+        c.execute("SELECT chunks.content, chunk_tags.source, chunk_tags.tag, chunk_tags.metadata FROM chunks "
+                  "JOIN chunk_tags ON chunk_tags.chunk_id = chunks.id AND chunk_tags.tag = ? WHERE chunks.hash = ?",
+                  (tag, h)).fetchone() for h in hashes], results)
+    timed("bm25 top-5 in one tag", lambda: search_chunks_bm25(conn, "word1 word2", tag, k=5), results)
+    timed("delete one collection", lambda: delete_collection(conn, f"Bench {tag.rsplit('_', 1)[1]}", tag), results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the crawled.db schema on a synthetic database.")
+    parser.add_argument("--chunks", type=int, default=1000000)
+    parser.add_argument("--tags", type=int, default=50)
+    parser.add_argument("--dir", default="bench_data")
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    legacy_path = os.path.join(args.dir, "legacy.db")
+    migrated_path = os.path.join(args.dir, "migrated.db")
+    for path in (legacy_path, migrated_path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    print(f"Building synthetic database with {args.chunks} chunks across {args.tags} tags...")
+    conn, hashes = build_legacy_db(legacy_path, args.chunks, args.tags)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    shutil.copyfile(legacy_path, migrated_path)
+
+    rng = random.Random(1)
+    tag = "__bench_0"
+    source = f"https://example.com/page{args.chunks // 40}"
+    sample = rng.sample(hashes, min(LOOKUPS, len(hashes)))
+
+    print("\nLegacy schema:")
+    conn = connect_db(legacy_path)
+    legacy = legacy_queries(conn, tag, source, sample)
+    conn.close()
+
+    print("\nMigrated schema:")
+    conn = connect_db(migrated_path)
+    start = time.perf_counter()
+    migrate_db(conn)
+    print(f"{'migration':<40} {(time.perf_counter() - start) * 1000:>12.1f} ms")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    migrated = migrated_queries(conn, tag, source, sample)
+    conn.close()
+
+    print(f"\n{'query':<40} {'legacy ms':>12} {'migrated ms':>12} {'speedup':>9}")
+    for label, legacy_s in legacy.items():
+        migrated_s = migrated[label]
+        print(f"{label:<40} {legacy_s * 1000:>12.1f} {migrated_s * 1000:>12.1f} {legacy_s / max(migrated_s, 1e-9):>8.1f}x")
+    print(f"\nDatabase size: legacy {os.path.getsize(legacy_path) / 2**20:.0f} MB, "
+          f"migrated {os.path.getsize(migrated_path) / 2**20:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
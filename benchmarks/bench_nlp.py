@@ -0,0 +1,78 @@
+# benchmarks/bench_nlp.py
+# Time sentence chunking of large synthetic documents: the legacy full en_core_web_sm pass against the streamed
+# sentencizer, single- and multi-process. Usage: python benchmarks/bench_nlp.py [--sizes-mb 1 50] [--processes 2]
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import spacy
+import nlp_utils
+from config import SPACY_MODEL
+
+VOCABULARY_SIZE = 5000
+
+
+def synthetic_text(size_bytes, seed=0):
+    """Paragraphs of 3-8 sentences of 5-25 words, roughly like extracted PDF text or a transcript."""
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(VOCABULARY_SIZE)]
+    paragraphs = []
+    total = 0
+    while total < size_bytes:
+        sentences = [" ".join(rng.choices(vocabulary, k=rng.randint(5, 25))).capitalize() + rng.choice(".!?")
+                     for _ in range(rng.randint(3, 8))]
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:size_bytes]
+
+
+def legacy_chunk(nlp, text):
+    doc = nlp(text)
+    [token.lemma_ for token in doc if not token.is_stop and not token.is_punct and token.text.strip()]
+    return [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    try:
+        value = fn()
+    except Exception as e:
+        print(f"{label:<44} {'failed':>10}  ({type(e).__name__}: {str(e).splitlines()[0][:60]})")
+        return None
+    elapsed = time.perf_counter() - start
+    print(f"{label:<44} {elapsed:>9.2f}s  ({len(value)} chunks/sentences)")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sentence chunking of large texts.")
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 50])
+    parser.add_argument("--processes", type=int, default=nlp_utils.NLP_PROCESSES)
+    args = parser.parse_args()
+
+    try:
+        legacy_nlp = spacy.load(SPACY_MODEL)
+    except OSError:
+        legacy_nlp = None
+        print(f"{SPACY_MODEL} is not installed; skipping the legacy full-pipeline pass.")
+
+    for size_mb in args.sizes_mb:
+        text = synthetic_text(int(size_mb * 2**20))
+        print(f"\n{size_mb:g} MB input ({len(text)} characters):")
+        if legacy_nlp is not None:
+            # The legacy code called nlp(text) directly, so anything over max_length fails outright
+            timed("legacy en_core_web_sm nlp(text)", lambda: legacy_chunk(legacy_nlp, text))
+        nlp_utils.NLP_PARALLEL_MIN_CHARS = float("inf")
+        timed("sentencizer, nlp.pipe, 1 process", lambda: nlp_utils.sentence_chunks(text))
+        nlp_utils.NLP_PROCESSES = args.processes
+        nlp_utils.NLP_PARALLEL_MIN_CHARS = 0
+        timed(f"sentencizer, nlp.pipe, {args.processes} processes", lambda: nlp_utils.sentence_chunks(text))
+
+
+if __name__ == "__main__":
+    main()
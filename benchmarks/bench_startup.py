@@ -0,0 +1,84 @@
+# benchmarks/bench_startup.py
+# Import each app module in a fresh interpreter and report wall time and resident memory it adds, then optionally
+# the cost of loading each registered resource. Usage: python benchmarks/bench_startup.py [--load] [modules ...]
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["config", "utils", "resource_utils", "db_utils", "nlp_utils", "augment_utils", "vectorstore_manager",
+           "cache_utils", "process_utils", "retriever_utils", "chat_utils", "web_utils", "youtube_utils",
+           "reddit_utils", "subreddit_utils", "file_utils", "view_utils"]
+
+# Runs in the child interpreter; prints one JSON line
+PROBE = r"""
+import sys, time, json, importlib
+sys.path.insert(0, sys.argv[1])
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+result = {"module": sys.argv[2]}
+before = rss_mb()
+start = time.perf_counter()
+try:
+    importlib.import_module(sys.argv[2])
+    result["import_s"] = time.perf_counter() - start
+    result["rss_mb"] = rss_mb() - before
+    if sys.argv[3] == "load":
+        import resource_utils
+        result["resources"] = {}
+        for name in resource_utils.get_resource_stats():
+            before = rss_mb()
+            start = time.perf_counter()
+            try:
+                resource_utils.get_resource(name)
+                result["resources"][name] = {"load_s": time.perf_counter() - start, "rss_mb": rss_mb() - before}
+            except Exception as e:
+                result["resources"][name] = {"error": f"{type(e).__name__}: {e}"}
+except Exception as e:
+    result["error"] = f"{type(e).__name__}: {e}"
+print(json.dumps(result))
+"""
+
+
+def probe(module, load):
+    completed = subprocess.run([sys.executable, "-c", PROBE, ROOT, module, "load" if load else "import"],
+                               capture_output=True, text=True, cwd=ROOT)
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("{")]
+    if not lines:
+        return {"module": module, "error": (completed.stderr.strip().splitlines() or ["no output"])[-1]}
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report import time and RSS per module.")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--load", action="store_true", help="Also load every resource the module registers")
+    args = parser.parse_args()
+
+    print(f"{'module':<22} {'import s':>9} {'RSS MB':>8}")
+    for module in args.modules:
+        result = probe(module, args.load)
+        if "import_s" not in result:
+            print(f"{module:<22} {'failed':>9}          {result['error'][:70]}")
+            continue
+        print(f"{module:<22} {result['import_s']:>9.2f} {result['rss_mb']:>8.1f}")
+        for name, stats in result.get("resources", {}).items():
+            if "error" in stats:
+                print(f"  load {name:<17} {'failed':>9}          {stats['error'][:70]}")
+            else:
+                print(f"  load {name:<17} {stats['load_s']:>9.2f} {stats['rss_mb']:>8.1f}")
+        if "error" in result:
+            print(f"  {result['error'][:90]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# browser_utils.py
+import os
+import queue
+import atexit
+import threading
+from contextlib import contextmanager
+from http.cookiejar import MozillaCookieJar
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.service import Service as ChromeService
+from selenium.webdriver.chrome.options import Options
+from webdriver_manager.chrome import ChromeDriverManager
+from config import BROWSER_POOL_SIZE, BROWSER_HEADLESS, BROWSER_MAX_USES, YOUTUBE_COOKIES_FILE
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def _get_driver_path():
+    # ChromeDriverManager hits the network to resolve a version; do it once per process, not once per driver
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            _driver_path = ChromeDriverManager().install()
+        return _driver_path
+
+
+def _load_cookies(driver, cookies_file):
+    """Seed the driver with a Netscape cookie file (as exported for yt-dlp) so consent and login carry over."""
+    jar = MozillaCookieJar(cookies_file)
+    jar.load(ignore_discard=True, ignore_expires=True)
+    # Cookies can only be set for the domain currently loaded
+    driver.get("https://www.youtube.com")
+    loaded = 0
+    for cookie in jar:
+        if not cookie.domain.lstrip(".").endswith("youtube.com"):
+            continue
+        entry = {"name": cookie.name, "value": cookie.value, "domain": cookie.domain, "path": cookie.path,
+                 "secure": bool(cookie.secure)}
+        if cookie.expires:
+            entry["expiry"] = int(cookie.expires)
+        try:
+            driver.add_cookie(entry)
+            loaded += 1
+        except WebDriverException as e:
+            print(f"Debug: Skipped cookie {cookie.name}: {e}")
+    print(f"Debug: Loaded {loaded} cookies from {cookies_file} into browser session.")
+
+
+class DriverPool:
+    """
+    Bounded pool of long-lived headless Chrome drivers. A driver keeps its session and cookies across videos and
+    is replaced when it crashes or after BROWSER_MAX_USES uses. Drivers are started lazily, up to size.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, headless=BROWSER_HEADLESS, max_uses=BROWSER_MAX_USES,
+                 cookies_file=YOUTUBE_COOKIES_FILE):
+        self.size = size
+        self.headless = headless
+        self.max_uses = max_uses
+        self.cookies_file = cookies_file
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._uses = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _create_driver(self):
+        options = Options()
+        if self.headless:
+            options.add_argument('--headless=new')
+        options.add_argument('--disable-notifications')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--window-size=1280,2000')
+        options.add_argument('--mute-audio')
+        options.add_experimental_option('excludeSwitches', ['enable-logging'])
+        options.add_argument('--log-level=3')
+        driver = webdriver.Chrome(service=ChromeService(_get_driver_path()), options=options)
+        if self.cookies_file and os.path.exists(self.cookies_file):
+            try:
+                _load_cookies(driver, self.cookies_file)
+            except (OSError, WebDriverException) as e:
+                print(f"Debug: Could not load cookies from {self.cookies_file}: {e}")
+        with self._lock:
+            self._uses[driver] = 0
+        print(f"Debug: Started browser driver ({'headless' if self.headless else 'headed'}).")
+        return driver
+
+    def _discard(self, driver):
+        with self._lock:
+            self._uses.pop(driver, None)
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+    @staticmethod
+    def _is_alive(driver):
+        try:
+            driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    @contextmanager
+    def driver(self):
+        """Lend a driver for one job. A crash inside the block recycles the driver; other errors propagate
+        and the driver is returned to the pool."""
+        if self._closed:
+            raise RuntimeError("Driver pool is closed.")
+        self._slots.acquire()
+        driver = None
+        try:
+            while driver is None:
+                try:
+                    driver = self._idle.get_nowait()
+                except queue.Empty:
+                    driver = self._create_driver()
+                    break
+                if not self._is_alive(driver):
+                    print("Debug: Recycling crashed browser driver.")
+                    self._discard(driver)
+                    driver = None
+            healthy = True
+            try:
+                yield driver
+            except TimeoutException:
+                raise
+            except WebDriverException:
+                healthy = self._is_alive(driver)
+                raise
+            finally:
+                with self._lock:
+                    self._uses[driver] = self._uses.get(driver, 0) + 1
+                    worn_out = self._uses[driver] >= self.max_uses
+                if not healthy or worn_out or self._closed:
+                    if worn_out:
+                        print(f"Debug: Recycling browser driver after {self.max_uses} uses.")
+                    self._discard(driver)
+                else:
+                    self._idle.put(driver)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_driver_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool()
+            atexit.register(_pool.close)
+        return _pool
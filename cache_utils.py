@@ -0,0 +1,66 @@
+# cache_utils.py
+import re
+import json
+from datetime import datetime, timedelta
+import numpy as np
+from vectorstore_manager import embeddings
+from config import ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_TTL_HOURS, ANSWER_CACHE_MAX_ENTRIES
+
+def normalize_question(question):
+    question = re.sub(r'\s+', ' ', question.strip().lower())
+    return question.rstrip('?!. ')
+
+def _embed_question(question):
+    vector = np.asarray(embeddings.embed_query(normalize_question(question)), dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+def get_collection_version(conn, tag):
+    c = conn.cursor()
+    c.execute("SELECT version FROM collection_versions WHERE tag = ?", (tag,))
+    row = c.fetchone()
+    return row[0] if row else 0
+
+def lookup_answer(conn, tag, question):
+    """Return (cached, version): cached is (answer, sources) of a cached answer to a near-identical question on the
+    current version of the collection, or None. Entries older than the TTL or from an older collection version never
+    match. Pass version on to store_answer so an answer generated while the collection changed is never served."""
+    version = get_collection_version(conn, tag)
+    query_vector = _embed_question(question)
+    cutoff = (datetime.now() - timedelta(hours=ANSWER_CACHE_TTL_HOURS)).isoformat()
+    c = conn.cursor()
+    c.execute("SELECT id, embedding, answer, sources FROM answer_cache WHERE tag = ? AND collection_version = ? AND created >= ?",
+              (tag, version, cutoff))
+    rows = c.fetchall()
+    best = None
+    best_score = ANSWER_CACHE_SIMILARITY
+    for entry_id, blob, answer, sources in rows:
+        cached_vector = np.frombuffer(blob, dtype=np.float32)
+        if cached_vector.shape != query_vector.shape:
+            continue
+        score = float(np.dot(cached_vector, query_vector))
+        if score >= best_score:
+            best, best_score = (entry_id, answer, sources), score
+    if best is None:
+        print(f"Debug: Answer cache miss for tag {tag} ({len(rows)} candidates).")
+        return None, version
+    entry_id, answer, sources = best
+    conn.execute("UPDATE answer_cache SET last_hit = ? WHERE id = ?", (datetime.now().isoformat(), entry_id))
+    conn.commit()
+    print(f"Debug: Answer cache hit for tag {tag} (similarity {best_score:.3f}).")
+    return (answer, json.loads(sources)), version
+
+def store_answer(conn, tag, version, question, answer, sources):
+    """Cache an answer under the collection version lookup_answer saw before retrieval."""
+    vector = _embed_question(question)
+    now = datetime.now().isoformat()
+    c = conn.cursor()
+    c.execute("INSERT INTO answer_cache (tag, collection_version, question, embedding, answer, sources, created, last_hit) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+              (tag, version, question, vector.tobytes(), answer, json.dumps(sorted(sources)), now, now))
+    # Drop expired entries, then the least recently used ones beyond the size bound
+    cutoff = (datetime.now() - timedelta(hours=ANSWER_CACHE_TTL_HOURS)).isoformat()
+    c.execute("DELETE FROM answer_cache WHERE created < ?", (cutoff,))
+    c.execute("DELETE FROM answer_cache WHERE id NOT IN (SELECT id FROM answer_cache ORDER BY last_hit DESC LIMIT ?)",
+              (ANSWER_CACHE_MAX_ENTRIES,))
+    conn.commit()
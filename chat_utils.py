@@ -1,22 +1,213 @@
 # chat_utils.py
 import os
-from config import MODEL_NAME, FAISS_PATH
+from config import MODEL_NAME, FAISS_PATH, CHAT_PIPELINE_MODE, CHAT_CONCURRENT_GENERATION, ANSWER_CACHE_ENABLED
+from config import RERANK_ENABLED, RERANK_CANDIDATES, RERANK_TOP_N
 from langchain_ollama import OllamaLLM
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain.chains import create_retrieval_chain, create_history_aware_retriever
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.retrievers import EnsembleRetriever
-from langchain_community.retrievers import BM25Retriever
 from langchain_core.documents import Document
 from vectorstore_manager import get_vectorstore
+from retriever_utils import SQLiteBM25Retriever, FederatedRetriever, RerankingRetriever
+from cache_utils import lookup_answer, store_answer
+from nlp_utils import extract_entities
 import time
-import spacy
+import queue
+import threading
+from collections import deque
 
-nlp = spacy.load("en_core_web_sm")
+# Streaming stats of recent chat generations (time to first token, tokens/sec), newest last
+recent_generation_stats = deque(maxlen=200)
 
-def chat_bot(message, history, conn=None, selected_source=None, selected_tag=None):
-    print(f"Starting chat_bot with message: {message}, selected_source: {selected_source}, selected_tag: {selected_tag}")
+def stream_chain(chain, inputs, stage):
+    """
+    Stream a chain's output, yielding (text_so_far, context_docs) after every token.
+    Works for plain LLM chains (string chunks) and retrieval chains (dict chunks with 'context' and 'answer').
+    Time to first token and tokens/sec are recorded in recent_generation_stats.
+    """
+    start = time.time()
+    first_token_time = None
+    token_count = 0
+    text = ""
+    docs = []
+    for chunk in chain.stream(inputs):
+        if isinstance(chunk, dict):
+            docs = chunk.get("context", docs)
+            token = chunk.get("answer", "")
+        else:
+            token = chunk
+        if not token:
+            continue
+        if first_token_time is None:
+            first_token_time = time.time()
+        token_count += 1
+        text += token
+        yield text, docs
+    end = time.time()
+    ttft = (first_token_time or end) - start
+    generation_time = end - (first_token_time or end)
+    tokens_per_sec = token_count / generation_time if generation_time > 0 else 0.0
+    recent_generation_stats.append({"stage": stage, "ttft_s": round(ttft, 3), "tokens": token_count, "tokens_per_s": round(tokens_per_sec, 1)})
+    print(f"Debug: {stage} streamed {token_count} tokens. Time to first token: {ttft:.2f}s, {tokens_per_sec:.1f} tokens/s")
+    if token_count == 0:
+        # Nothing streamed (e.g. empty answer); still report retrieved docs
+        yield text, docs
+
+SUMMARY_PROMPT = "Summarize the following retrieved content related to the question '{input}' in a concise manner:\n\n{context}"
+QA_PROMPT = "Use the context to answer the question as accurately as possible. If lyrics are present, extract and format them clearly with verses, chorus, etc., and ignore non-lyric content like discussions. If uncertain or incomplete, note limitations but provide what's available:\n\n{context}\n\nQuestion: {input}"
+REPHRASE_INSTRUCTION = "Given the above conversation, generate a search query to look up in order to get information relevant to the conversation. Focus on the current question and ignore unrelated history."
+
+def _rephrase_prompt():
+    return ChatPromptTemplate.from_messages(
+        [
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("human", "{input}"),
+            ("human", REPHRASE_INSTRUCTION),
+        ]
+    )
+
+def _collect_sources(docs):
+    # Collect unique sources from retrieved documents
+    return {doc.metadata['source'] for doc in docs if 'source' in doc.metadata}
+
+def _format_sources(sources):
+    if not sources:
+        return ""
+    out = "**Referenced Sources:**\n"
+    for source in sources:
+        out += f"- {source}\n"
+    return out
+
+def _stream_concurrently(streams):
+    """Consume several stream_chain generators on their own threads and yield (stage, text_so_far) as tokens arrive."""
+    updates = queue.Queue()
+
+    def consume(stage, stream):
+        try:
+            for text, _ in stream:
+                updates.put((stage, text, None))
+        except Exception as e:
+            updates.put((stage, None, e))
+        finally:
+            updates.put((stage, None, StopIteration))
+
+    for stage, stream in streams.items():
+        threading.Thread(target=consume, args=(stage, stream), daemon=True).start()
+    remaining = len(streams)
+    while remaining:
+        stage, text, error = updates.get()
+        if error is StopIteration:
+            remaining -= 1
+        elif error is not None:
+            raise error
+        else:
+            yield stage, text
+
+def _run_single_retrieval_pipeline(llm, retriever, message, prior_history, response, history):
+    """Retrieve once and feed the same documents to the summary and the answer, which are generated concurrently.
+    The history-aware rephrase only runs when there is earlier conversation. Returns (answer_text, sources)."""
+    timings = {}
+    response += "Vector store ready.\n\n"
+    history[-1]["content"] = response
+    yield history, ""
+
+    search_query = message
+    if prior_history:
+        start = time.time()
+        search_query = (_rephrase_prompt() | llm).invoke({"input": message, "chat_history": prior_history}).strip() or message
+        timings["rephrase"] = time.time() - start
+        print(f"Debug: Rephrased search query: {search_query}")
+
+    start = time.time()
+    docs = retriever.invoke(search_query)
+    timings["retrieval"] = time.time() - start
+    print("Retrieved docs:", [doc.metadata for doc in docs])
+
+    response += "Generating summarization and specific answer...\n"
+    history[-1]["content"] = response
+    yield history, ""
+
+    summary_chain = create_stuff_documents_chain(llm, ChatPromptTemplate.from_template(SUMMARY_PROMPT))
+    qa_chain = create_stuff_documents_chain(llm, ChatPromptTemplate.from_template(QA_PROMPT))
+    inputs = {"input": message, "context": docs}
+    streams = {
+        "summary": stream_chain(summary_chain, inputs, "summary"),
+        "answer": stream_chain(qa_chain, inputs, "answer"),
+    }
+    texts = {"summary": "", "answer": ""}
+    start = time.time()
+    if CHAT_CONCURRENT_GENERATION:
+        updates = _stream_concurrently(streams)
+    else:
+        updates = ((stage, text) for stage, stream in streams.items() for text, _ in stream)
+    for stage, text in updates:
+        texts[stage] = text
+        history[-1]["content"] = (response + f"**Summarization of Found Content:**\n{texts['summary']}\n\n"
+                                  + f"**Specific Answer:**\n{texts['answer']}\n\n")
+        yield history, ""
+    timings["generation"] = time.time() - start
+
+    print("Debug: Stage timings: " + ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items()))
+    answer_text = f"**Summarization of Found Content:**\n{texts['summary']}\n\n**Specific Answer:**\n{texts['answer']}\n\n"
+    sources = _collect_sources(docs)
+    response += answer_text + _format_sources(sources)
+    history[-1]["content"] = response
+    yield history, ""
+    return answer_text, sources
+
+def _run_legacy_pipeline(llm, retriever, message, chat_history, response, history):
+    """Original pipeline: separate retrievals for the summary and for the history-aware answer. Returns (answer_text, sources)."""
+    response += "Vector store ready.\n\n"
+    history[-1]["content"] = response
+    yield history, ""
+
+    response += "Generating summarization of the found content...\n"
+    history[-1]["content"] = response
+    yield history, ""
+
+    summary_prompt = ChatPromptTemplate.from_template(SUMMARY_PROMPT)
+    summary_chain = create_stuff_documents_chain(llm, summary_prompt)
+    summary_chain_with_docs = create_retrieval_chain(retriever, summary_chain)
+    summary_docs = []
+    summary = ""
+    for summary, summary_docs in stream_chain(summary_chain_with_docs, {"input": message}, "summary"):
+        history[-1]["content"] = response + f"**Summarization of Found Content:**\n{summary}\n\n"
+        yield history, ""
+    print("Retrieved docs for summary:", [doc.metadata for doc in summary_docs])
+
+    response += f"**Summarization of Found Content:**\n{summary}\n\n"
+
+    response += "Generating specific answer to the prompt...\n"
+    history[-1]["content"] = response
+    yield history, ""
+
+    rephrase_prompt = _rephrase_prompt()
+    history_aware_retriever = create_history_aware_retriever(llm, retriever, rephrase_prompt)
+
+    qa_prompt = ChatPromptTemplate.from_template(QA_PROMPT)
+    qa_chain = create_stuff_documents_chain(llm, qa_prompt)
+    qa_chain_with_docs = create_retrieval_chain(history_aware_retriever, qa_chain)
+    qa_docs = []
+    answer = ""
+    for answer, qa_docs in stream_chain(qa_chain_with_docs, {"input": message, "chat_history": chat_history}, "answer"):
+        history[-1]["content"] = response + f"**Specific Answer:**\n{answer}\n\n"
+        yield history, ""
+    print("Retrieved docs for QA:", [doc.metadata for doc in qa_docs])
+
+    response += f"**Specific Answer:**\n{answer}\n\n"
+
+    sources = _collect_sources(summary_docs + qa_docs)
+    if sources:
+        response += _format_sources(sources)
+        history[-1]["content"] = response
+        yield history, ""
+    return f"**Summarization of Found Content:**\n{summary}\n\n**Specific Answer:**\n{answer}\n\n", sources
+
+def chat_bot(message, history, conn=None, selected_tags=None):
+    selected_tags = list(selected_tags or [])
+    print(f"Starting chat_bot with message: {message}, selected_tags: {selected_tags}")
     history.append({"role": "user", "content": message})
     yield history, ""
 
@@ -25,8 +216,7 @@ def chat_bot(message, history, conn=None, selected_source=None, selected_tag=Non
     yield history, ""
 
     # NLP processing for intent and NER
-    doc = nlp(message)
-    entities = [ent.text for ent in doc.ents]
+    entities = extract_entities(message)
     print(f"Debug: Extracted entities: {entities}")
 
     chat_history = []
@@ -39,94 +229,61 @@ def chat_bot(message, history, conn=None, selected_source=None, selected_tag=Non
     llm = OllamaLLM(model=MODEL_NAME)
 
     retriever = None
-    if selected_source != "No RAG":
+    if selected_tags:
         response += "**Processing Status:**\n"
-        vs = get_vectorstore(selected_tag)
-        print(f"Debug: Vector store for tag {selected_tag} loaded with ntotal: {vs.index.ntotal}")
-        if vs.index.ntotal == 0:
+        searchable_tags = []
+        for tag in selected_tags:
+            try:
+                vs = get_vectorstore(tag)
+            except ValueError as e:
+                response += f"Could not load source '{tag}': {e}\n"
+                continue
+            print(f"Debug: Vector store for tag {tag} loaded with ntotal: {vs.index.ntotal}")
+            if vs.index.ntotal:
+                searchable_tags.append(tag)
+        if not searchable_tags:
             response += "No relevant content in vectorstore.\n\n**Specific Answer:**\nSorry, I couldn't find any information."
             history[-1]["content"] = response
             yield history, ""
             return
-        search_kwargs = {"k": 5, "filter": {"tag": selected_tag}}
-        if 'lyrics' in message.lower():
-            search_kwargs["filter"]["source_type"] = "lyrics"
-        dense_retriever = vs.as_retriever(search_kwargs=search_kwargs)
-        bm_docs = vs.similarity_search(" ", k=min(vs.index.ntotal, 100))  # Limit to avoid large empty stores
-        bm25_retriever = BM25Retriever.from_documents(bm_docs)
+        search_filter = {"source_type": "lyrics"} if 'lyrics' in message.lower() else None
+        # With reranking, each retriever over-fetches and the cross-encoder keeps only the best few for the prompt
+        k = RERANK_CANDIDATES if RERANK_ENABLED else 5
+        dense_retriever = FederatedRetriever(tags=searchable_tags, k=k, filter=search_filter)
+        bm25_retriever = SQLiteBM25Retriever(tags=searchable_tags, k=k)
         retriever = EnsembleRetriever(retrievers=[dense_retriever, bm25_retriever], weights=[0.7, 0.3])
-        print(f"Debug: Created ensemble retriever for tag {selected_tag}. BM25 docs loaded: {len(bm_docs)}")
+        if RERANK_ENABLED:
+            retriever = RerankingRetriever(base_retriever=retriever, top_n=RERANK_TOP_N)
+        print(f"Debug: Created ensemble retriever over tags {searchable_tags} with persistent BM25 index"
+              f"{' and cross-encoder reranking' if RERANK_ENABLED else ''}.")
 
     if retriever is None:
         qa_prompt = ChatPromptTemplate.from_template(
             "Answer the question:\n\nQuestion: {input}"
         )
         qa_chain = qa_prompt | llm
-        answer = qa_chain.invoke({"input": message})
-        response = f"**Specific Answer:**\n{answer}\n\n"
-        history[-1]["content"] = response
-        yield history, ""
-    else:
-        response += "Vector store ready.\n\n"
-        history[-1]["content"] = response
-        yield history, ""
-
-        response += "Generating summarization of the found content...\n"
-        history[-1]["content"] = response
-        yield history, ""
-
-        summary_prompt = ChatPromptTemplate.from_template(
-            "Summarize the following retrieved content related to the question '{input}' in a concise manner:\n\n{context}"
-        )
-        summary_chain = create_stuff_documents_chain(llm, summary_prompt)
-        summary_chain_with_docs = create_retrieval_chain(retriever, summary_chain)
-        summary_response = summary_chain_with_docs.invoke({"input": message})
-        summary_docs = summary_response["context"]  # Log retrieved docs
-        print("Retrieved docs for summary:", [doc.metadata for doc in summary_docs])
-        summary = summary_response["answer"]
-
-        response += f"**Summarization of Found Content:**\n{summary}\n\n"
-        history[-1]["content"] = response
-        yield history, ""
-
-        response += "Generating specific answer to the prompt...\n"
-        history[-1]["content"] = response
-        yield history, ""
-
-        rephrase_prompt = ChatPromptTemplate.from_messages(
-            [
-                MessagesPlaceholder(variable_name="chat_history"),
-                ("human", "{input}"),
-                ("human", "Given the above conversation, generate a search query to look up in order to get information relevant to the conversation. Focus on the current question and ignore unrelated history."),
-            ]
-        )
-        history_aware_retriever = create_history_aware_retriever(llm, retriever, rephrase_prompt)
-
-        qa_prompt = ChatPromptTemplate.from_template(
-            "Use the context to answer the question as accurately as possible. If lyrics are present, extract and format them clearly with verses, chorus, etc., and ignore non-lyric content like discussions. If uncertain or incomplete, note limitations but provide what's available:\n\n{context}\n\nQuestion: {input}"
-        )
-        qa_chain = create_stuff_documents_chain(llm, qa_prompt)
-        qa_chain_with_docs = create_retrieval_chain(history_aware_retriever, qa_chain)
-        qa_response = qa_chain_with_docs.invoke({"input": message, "chat_history": chat_history})
-        qa_docs = qa_response["context"]  # Log retrieved docs
-        print("Retrieved docs for QA:", [doc.metadata for doc in qa_docs])
-        answer = qa_response["answer"]
-
-        response += f"**Specific Answer:**\n{answer}\n\n"
-        history[-1]["content"] = response
-        yield history, ""
-
-        # Collect unique sources from retrieved documents
-        all_docs = set()
-        for doc in summary_docs + qa_docs:
-            if 'source' in doc.metadata:
-                all_docs.add(doc.metadata['source'])
-
-        if all_docs:
-            response += "**Referenced Sources:**\n"
-            for source in all_docs:
-                response += f"- {source}\n"
-            history[-1]["content"] = response
+        for answer, _ in stream_chain(qa_chain, {"input": message}, "answer"):
+            history[-1]["content"] = f"**Specific Answer:**\n{answer}\n\n"
             yield history, ""
+    else:
+        prior_history = chat_history[:-1]
+        # Cached answers only stand in for first-turn questions on a single collection; later turns depend on the
+        # conversation, and cache entries are versioned per collection
+        use_answer_cache = ANSWER_CACHE_ENABLED and not prior_history and len(selected_tags) == 1
+        if use_answer_cache:
+            cached, cache_version = lookup_answer(conn, selected_tags[0], message)
+            if cached:
+                answer_text, sources = cached
+                response += "Answer served from cache.\n\n" + answer_text + _format_sources(sources)
+                history[-1]["content"] = response
+                yield history, ""
+                print("chat_bot completed.")
+                return
+        if CHAT_PIPELINE_MODE == "legacy":
+            answer_text, sources = yield from _run_legacy_pipeline(llm, retriever, message, chat_history, response, history)
+        else:
+            answer_text, sources = yield from _run_single_retrieval_pipeline(llm, retriever, message, prior_history, response, history)
+        if use_answer_cache:
+            store_answer(conn, selected_tags[0], cache_version, message, answer_text, sources)
 
     print("chat_bot completed.")
\ No newline at end of file
@@ -8,4 +8,64 @@ MAX_URLS = 10
 MAX_DISPLAY_CHARS = 1000  # For cleaned text display
 DEFAULT_CONTEXT_LENGTH = 8192  # Recommended for Qwen2.5-7B on 4090: up to 128K, but 8K-32K safe for VRAM
 DEFAULT_BATCH_SIZE = 1  # For inference on 4090, can be 1-4
-DEFAULT_PRECISION = "fp16"  # FP16 or BF16 for 4090 (24GB VRAM handles 7B easily)
\ No newline at end of file
+DEFAULT_PRECISION = "fp16"  # FP16 or BF16 for 4090 (24GB VRAM handles 7B easily)
+VECTORSTORE_CACHE_MAX_MB = 2048  # Memory budget for loaded collections kept in the process-wide vectorstore cache
+EMBEDDING_BACKEND = "huggingface"  # "huggingface" (local sentence-transformers model) or "ollama"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"  # Small 384-dim model; use e.g. "nomic-embed-text" with the ollama backend
+EMBEDDING_DEVICE = "cpu"  # Keep embeddings off the GPU so they don't compete with the chat model
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_MAX_WORKERS = 4  # Upper bound on concurrent embedding batches sent to the embedding backend
+WAL_COMPACT_MIN_ENTRIES = 5000  # Never rewrite a collection snapshot for fewer appended chunks than this
+WAL_COMPACT_RATIO = 0.5  # Rewrite the snapshot once the append log holds this fraction of the snapshot's vectors
+DB_PATH = "crawled.db"
+DOCSTORE_BACKEND = "sqlite"  # "sqlite" reads chunk text from crawled.db on demand; "memory" pickles it into index.pkl
+VECTORSTORE_MMAP = True  # Memory-map saved vectors of sqlite-backed collections instead of reading them into RAM
+FETCH_MAX_WORKERS = 8  # Concurrent page downloads per web collection
+FETCH_PER_HOST_LIMIT = 2  # Concurrent requests to any single host
+FETCH_TIMEOUT = 10  # Seconds
+OLLAMA_URL = "http://localhost:11434"
+AUGMENT_MAX_WORKERS = 4  # Concurrent augmentation requests; match OLLAMA_NUM_PARALLEL on the server
+AUGMENT_MAX_RETRIES = 2  # Retries per chunk with exponential backoff before keeping the original text
+AUGMENT_TIMEOUT = 30  # Seconds per augmentation request
+CHAT_PIPELINE_MODE = "single"  # "single": retrieve once per turn for summary and answer; "legacy": separate retrieval per chain
+CHAT_CONCURRENT_GENERATION = True  # Generate summary and answer in parallel (set OLLAMA_NUM_PARALLEL >= 2 on the server)
+ANSWER_CACHE_ENABLED = True  # Reuse answers to near-identical first-turn questions on an unchanged collection
+ANSWER_CACHE_SIMILARITY = 0.95  # Minimum cosine similarity between normalized question embeddings
+ANSWER_CACHE_TTL_HOURS = 24
+ANSWER_CACHE_MAX_ENTRIES = 1000
+EMBEDDING_CACHE_SIZE = 10000  # In-memory LRU of embedded queries
+EMBEDDING_DISK_CACHE = "embedding_cache.db"  # SQLite file backing the query embedding cache across restarts; None to disable
+EMBEDDING_DISK_CACHE_MAX_ENTRIES = 20000  # Oldest query embeddings are pruned from the disk cache beyond this
+LOCK_WAIT_WARN_SECONDS = 1.0  # Log any collection lock acquisition that waits longer than this
+# Hours before stored content is considered stale, per source kind (see db_utils.source_kind); None never expires
+SOURCE_TTLS = {"web": 24, "reddit": 6, "youtube": 24 * 30, "file": None}
+BROWSER_POOL_SIZE = 2  # Long-lived headless Chrome drivers; also the number of videos scraped in parallel
+BROWSER_HEADLESS = True
+BROWSER_MAX_USES = 50  # Restart a driver after this many videos to bound browser memory growth
+BROWSER_WAIT_TIMEOUT = 10  # Seconds to wait for each transcript panel element
+YOUTUBE_COOKIES_FILE = "www.youtube.com_cookies.txt"  # Netscape cookie file loaded into each browser session
+YOUTUBE_FETCH_WORKERS = 4  # Videos fetched concurrently per YouTube collection
+YOUTUBE_TRANSCRIPT_TIERS = ["transcript_api", "yt_dlp", "browser"]  # Tried in order until one returns a transcript
+YOUTUBE_TRANSCRIPT_LANGUAGES = ["en", "en-US", "en-GB"]  # Caption languages accepted by the direct tiers, in preference order
+SPACY_MODEL = "en_core_web_sm"  # Only used for entity extraction; chunking uses the rule-based sentencizer
+NLP_SEGMENT_CHARS = 100000  # Large texts are streamed through spaCy in segments of at most this many characters
+NLP_BATCH_SIZE = 8  # Segments per nlp.pipe batch
+NLP_PROCESSES = max(1, min(4, (os.cpu_count() or 1) - 1))  # Worker processes for nlp.pipe on large texts
+NLP_PARALLEL_MIN_CHARS = 5000000  # Below this, worker start-up costs more than it saves
+WARMUP_RESOURCES = ["embeddings", "sentencizer", "ner"]  # Loaded in the background once the UI is built; others load on first use
+ANN_INDEX_TYPE = "auto"  # "auto" sizes each collection's index to its chunk count; or pin "flat", "hnsw", "ivf", "ivfpq" or "sq8"
+ANN_FLAT_MAX_VECTORS = 20000  # Exact search below this; HNSW (else IVF) up to ANN_HNSW_MAX_VECTORS; compressed IVF (PQ or SQ8) above
+ANN_HNSW_MAX_VECTORS = 250000
+ANN_RECALL_TARGET = 0.95  # recall@10 against exact search that a candidate index and its search parameter must reach
+SEARCH_MAX_WORKERS = 8  # Collections searched concurrently by a federated (multi-collection) search
+RERANK_ENABLED = False  # Re-score over-fetched chat candidates with a local cross-encoder before prompting
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"  # ~22M params; fast enough on CPU for tens of pairs
+RERANK_DEVICE = "cpu"
+RERANK_CANDIDATES = 50  # Candidates fetched per retriever and scored by the cross-encoder
+RERANK_TOP_N = 3  # Chunks passed to the LLM after reranking
+RERANK_BATCH_SIZE = 16
+RERANK_BUDGET_MS = 500  # Per-query time budget; beyond it the ensemble order is used
+INGEST_QUEUE_SIZE = 32  # Items buffered between ingestion stages before the upstream stage blocks (backpressure)
+INGEST_STAGE_WORKERS = {"source": 1, "fetch": 4, "clean": 2, "chunk": 2, "dedupe": 1, "embed": 2, "index": 1}  # Threads per stage; sources may override fetch/clean
+TASK_WORKERS = 3  # Background collection/ingestion tasks run at once; the rest wait in the tasks table of crawled.db
+TASK_RESOURCE_LIMITS = {"ollama": 1, "browser": 1, "http": 2}  # Running tasks allowed to use each resource at once
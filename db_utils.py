@@ -2,112 +2,356 @@
 import os
 import sqlite3
 from datetime import datetime, timedelta
-import hashlib
-from utils import lock
+import json
+import re
+from utils import hash_chunk, connect_db, get_collection_lock
 import shutil
-from config import FAISS_PATH
+from config import FAISS_PATH, SOURCE_TTLS
+from vectorstore_manager import evict_vectorstore
 
-def init_db():
-    print("Debug: Initializing database...")
-    conn = sqlite3.connect('crawled.db', check_same_thread=False)
-    c = conn.cursor()
+def _migration_base_schema(c):
+    """Base tables, including the columns older databases gained through ad hoc ALTERs."""
     c.execute('''CREATE TABLE IF NOT EXISTS urls
                  (url TEXT PRIMARY KEY, timestamp DATETIME, cleaned_text TEXT)''')
     c.execute('''CREATE TABLE IF NOT EXISTS chunks
                  (hash TEXT PRIMARY KEY, content TEXT, source TEXT, tag TEXT)''')
     c.execute('''CREATE TABLE IF NOT EXISTS collections
                  (name TEXT PRIMARY KEY, tag TEXT)''')
-    # Add tag column if not exists (for migration)
-    try:
-        c.execute("ALTER TABLE chunks ADD COLUMN tag TEXT")
-        print("Debug: Added 'tag' column to chunks table.")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" not in str(e):
-            raise e
-        print("Debug: 'tag' column already exists in chunks table.")
-    conn.commit()
-    print("Debug: Database initialized.")
+    c.execute('''CREATE TABLE IF NOT EXISTS augment_cache
+                 (key TEXT PRIMARY KEY, model TEXT, response TEXT, created DATETIME)''')
+    # Bumped whenever a tag gains chunks; cached chat answers are only valid for the version they were built on
+    c.execute('''CREATE TABLE IF NOT EXISTS collection_versions
+                 (tag TEXT PRIMARY KEY, version INTEGER)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS answer_cache
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, tag TEXT, collection_version INTEGER, question TEXT,
+                  embedding BLOB, answer TEXT, sources TEXT, created DATETIME, last_hit DATETIME)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_tag ON answer_cache (tag, collection_version)")
+    for column in ("tag", "metadata"):
+        try:
+            c.execute(f"ALTER TABLE chunks ADD COLUMN {column} TEXT")
+            print(f"Debug: Added '{column}' column to chunks table.")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" not in str(e):
+                raise e
+
+def _migration_normalize_chunks(c):
+    """Split chunks into content (integer id, unique hash) and per-collection membership, with indexes."""
+    c.execute("ALTER TABLE chunks RENAME TO chunks_legacy")
+    c.execute('''CREATE TABLE chunks
+                 (id INTEGER PRIMARY KEY, hash TEXT NOT NULL UNIQUE, content TEXT NOT NULL)''')
+    c.execute("INSERT INTO chunks (hash, content) SELECT hash, content FROM chunks_legacy")
+    # A chunk's text is stored once; the same text can belong to several collections with its own source and metadata
+    c.execute('''CREATE TABLE chunk_tags
+                 (chunk_id INTEGER NOT NULL REFERENCES chunks (id), tag TEXT NOT NULL, source TEXT, metadata TEXT,
+                  PRIMARY KEY (tag, chunk_id)) WITHOUT ROWID''')
+    c.execute('''INSERT INTO chunk_tags (chunk_id, tag, source, metadata)
+                 SELECT chunks.id, chunks_legacy.tag, chunks_legacy.source, chunks_legacy.metadata
+                 FROM chunks_legacy JOIN chunks ON chunks.hash = chunks_legacy.hash
+                 WHERE chunks_legacy.tag IS NOT NULL''')
+    c.execute("DROP TABLE chunks_legacy")
+    c.execute("CREATE INDEX idx_chunk_tags_chunk ON chunk_tags (chunk_id)")
+    c.execute("CREATE INDEX idx_chunk_tags_source ON chunk_tags (source)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_collections_tag ON collections (tag)")
+    c.execute('''CREATE VIEW tagged_chunks AS
+                 SELECT chunks.id, chunks.hash, chunks.content, chunk_tags.source, chunk_tags.tag, chunk_tags.metadata
+                 FROM chunk_tags JOIN chunks ON chunks.id = chunk_tags.chunk_id''')
+    # Full-text index over chunk content for BM25 lexical retrieval; reads the text from chunks instead of copying it
+    c.execute("DROP TABLE IF EXISTS chunks_fts")
+    c.execute("CREATE VIRTUAL TABLE chunks_fts USING fts5(content, content='chunks', content_rowid='id')")
+    c.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+
+def _migration_url_validators(c):
+    """HTTP validators for conditional revalidation of stored pages."""
+    c.execute("ALTER TABLE urls ADD COLUMN etag TEXT")
+    c.execute("ALTER TABLE urls ADD COLUMN last_modified TEXT")
+
+def _migration_tasks(c):
+    """Durable background task queue."""
+    c.execute('''CREATE TABLE tasks
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL, name TEXT, params TEXT NOT NULL,
+                  priority INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL DEFAULT 'queued', message TEXT, tag TEXT,
+                  result TEXT, cancel_requested INTEGER NOT NULL DEFAULT 0,
+                  created DATETIME, started DATETIME, finished DATETIME)''')
+    c.execute("CREATE INDEX idx_tasks_queue ON tasks (status, priority DESC, id)")
+
+# Applied in order; PRAGMA user_version records how many have run. Append new migrations, never edit old ones.
+MIGRATIONS = [
+    _migration_base_schema,
+    _migration_normalize_chunks,
+    _migration_url_validators,
+    _migration_tasks,
+]
+
+def migrate_db(conn):
+    c = conn.cursor()
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        print(f"Debug: Applying database migration {number}: {migration.__doc__}")
+        # Each migration and its version bump commit together, so a failed step leaves the previous version intact
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            migration(c)
+            c.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    if version < len(MIGRATIONS):
+        # Rebuilt tables leave their old pages on the freelist; give the space back once
+        conn.execute("VACUUM")
+    return len(MIGRATIONS)
+
+def init_db():
+    print("Debug: Initializing database...")
+    conn = connect_db()
+    version = migrate_db(conn)
+    print(f"Debug: Database initialized at schema version {version}.")
     return conn
 
+def source_kind(url):
+    if not url.startswith(("http://", "https://")):
+        return "file"
+    host = url.split("/")[2].lower()
+    if "youtube.com" in host or "youtu.be" in host:
+        return "youtube"
+    if "reddit.com" in host:
+        return "reddit"
+    return "web"
+
+def _is_fresh(url, ts_str):
+    ttl_hours = SOURCE_TTLS.get(source_kind(url), SOURCE_TTLS["web"])
+    if ttl_hours is None:
+        return True
+    return datetime.now() - datetime.fromisoformat(ts_str) < timedelta(hours=ttl_hours)
+
+def _chunked_in_query(conn, sql, values, params=()):
+    """
+    Run sql, whose {placeholders} stands for an IN list, once per 500 values so long lists stay under SQLite's
+    bound-parameter limit. params are bound before each batch; conn may be a connection or a cursor. Returns all rows.
+    """
+    values = list(values)
+    rows = []
+    for start in range(0, len(values), 500):
+        batch = values[start:start + 500]
+        rows.extend(conn.execute(sql.format(placeholders=",".join("?" * len(batch))), [*params, *batch]).fetchall())
+    return rows
+
+def get_url_freshness(conn, urls):
+    """
+    Look up stored pages without reading their text. Returns {url: {"fresh", "timestamp", "etag", "last_modified"}}
+    for the URLs that have a row; fresh means younger than the TTL configured for the URL's source kind.
+    """
+    urls = list(dict.fromkeys(urls))
+    found = {}
+    for url, ts_str, etag, last_modified in _chunked_in_query(
+            conn, "SELECT url, timestamp, etag, last_modified FROM urls WHERE url IN ({placeholders})", urls):
+        found[url] = {"fresh": _is_fresh(url, ts_str), "timestamp": ts_str, "etag": etag, "last_modified": last_modified}
+    print(f"Debug: Freshness lookup for {len(urls)} URLs: {sum(info['fresh'] for info in found.values())} fresh, "
+          f"{len(found) - sum(info['fresh'] for info in found.values())} stale, {len(urls) - len(found)} unseen.")
+    return found
+
+def get_stored_contents(conn, urls):
+    """Return {url: cleaned_text} for the stored URLs, in one query per 500 URLs. Does not check freshness."""
+    return dict(_chunked_in_query(conn, "SELECT url, cleaned_text FROM urls WHERE url IN ({placeholders})",
+                                  dict.fromkeys(urls)))
+
 def get_stored_content(conn, url):
     print(f"Debug: Checking stored content for URL: {url}")
-    with lock:
-        c = conn.cursor()
-        c.execute("SELECT cleaned_text, timestamp FROM urls WHERE url = ?", (url,))
-        result = c.fetchone()
-        if result:
-            text, ts_str = result
-            ts = datetime.fromisoformat(ts_str)
-            if datetime.now() - ts < timedelta(days=1):
-                print(f"Debug: Found recent stored content for {url}")
-                return text
-            else:
-                print(f"Debug: Stored content for {url} is outdated. Will fetch new content.")
-        else:
-            print(f"Debug: No stored content found for {url}. Will fetch and process new content.")
-    return None
-
-def store_content(conn, url, cleaned_text):
+    info = get_url_freshness(conn, [url]).get(url)
+    if info is None:
+        print(f"Debug: No stored content found for {url}. Will fetch and process new content.")
+        return None
+    if not info["fresh"]:
+        print(f"Debug: Stored content for {url} is outdated. Will fetch new content.")
+        return None
+    print(f"Debug: Found recent stored content for {url}")
+    return get_stored_contents(conn, [url]).get(url)
+
+def store_content(conn, url, cleaned_text, etag=None, last_modified=None):
     print(f"Debug: Storing content for URL: {url}")
     ts = datetime.now().isoformat()
-    with lock:
-        c = conn.cursor()
-        c.execute("INSERT OR REPLACE INTO urls (url, timestamp, cleaned_text) VALUES (?, ?, ?) ",
-                  (url, ts, cleaned_text))
-        conn.commit()
+    c = conn.cursor()
+    c.execute("INSERT OR REPLACE INTO urls (url, timestamp, cleaned_text, etag, last_modified) VALUES (?, ?, ?, ?, ?)",
+              (url, ts, cleaned_text, etag, last_modified))
+    conn.commit()
     print(f"Debug: Content stored for {url}")
 
-def add_chunk_if_new(conn, content, source, tag=None):
-    print(f"Debug: Adding new chunk if not exists for source: {source}, tag: {tag}")
-    chunk_hash = hashlib.sha256(content.encode()).hexdigest()
-    with lock:
-        c = conn.cursor()
-        c.execute("SELECT hash FROM chunks WHERE hash = ?", (chunk_hash,))
-        if not c.fetchone():
-            c.execute("INSERT INTO chunks (hash, content, source, tag) VALUES (?, ?, ?, ?)",
-                      (chunk_hash, content, source, tag))
-            conn.commit()
-            print("Debug: New chunk added.")
-            return True
-        else:
-            print("Debug: Chunk already exists.")
-    return False
+def mark_revalidated(conn, url, etag=None, last_modified=None):
+    # The server answered 304: keep the stored text, restart its TTL and take any refreshed validators
+    c = conn.cursor()
+    c.execute("UPDATE urls SET timestamp = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) "
+              "WHERE url = ?", (datetime.now().isoformat(), etag, last_modified, url))
+    conn.commit()
+    print(f"Debug: Stored content for {url} revalidated (not modified).")
+
+def _bump_collection_version(c, tag):
+    # New content invalidates every cached answer for the tag
+    c.execute("INSERT INTO collection_versions (tag, version) VALUES (?, 1) "
+              "ON CONFLICT(tag) DO UPDATE SET version = version + 1", (tag,))
+    c.execute("DELETE FROM answer_cache WHERE tag = ?", (tag,))
+
+def _hash_chunks(contents):
+    # Chunks are a few hundred bytes, too small for hashlib to release the GIL, so threads would only add overhead
+    return [hash_chunk(content) for content in contents]
+
+def _chunk_ids(c, hashes):
+    return dict(_chunked_in_query(c, "SELECT hash, id FROM chunks WHERE hash IN ({placeholders})", hashes))
+
+def add_chunks_if_new(conn, items):
+    """
+    Insert the chunks of a document in one transaction. items is a list of (content, source, tag, metadata) tuples;
+    returns a list of booleans, True where the chunk is new to its tag (repeats within items count once). Text
+    already stored for another tag is linked to this one rather than stored again.
+    """
+    if not items:
+        return []
+    if any(tag is None for _, _, tag, _ in items):
+        raise ValueError("Every chunk must belong to a collection tag.")
+    hashes = _hash_chunks([content for content, _, _, _ in items])
+    c = conn.cursor()
+    # Take the write lock up front so a concurrent ingester can't insert the same hash between lookup and insert
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        ids = _chunk_ids(c, list(set(hashes)))
+        new_chunks = {}
+        for chunk_hash, (content, _, _, _) in zip(hashes, items):
+            if chunk_hash not in ids:
+                new_chunks.setdefault(chunk_hash, content)
+        if new_chunks:
+            c.executemany("INSERT INTO chunks (hash, content) VALUES (?, ?)", new_chunks.items())
+            ids.update(_chunk_ids(c, list(new_chunks)))
+            c.executemany("INSERT INTO chunks_fts (rowid, content) VALUES (?, ?)",
+                          [(ids[chunk_hash], content) for chunk_hash, content in new_chunks.items()])
+        linked = set()
+        for tag in {tag for _, _, tag, _ in items}:
+            chunk_ids = list({ids[chunk_hash] for chunk_hash, (_, _, item_tag, _) in zip(hashes, items) if item_tag == tag})
+            linked.update((chunk_id, tag) for chunk_id, in _chunked_in_query(
+                c, "SELECT chunk_id FROM chunk_tags WHERE tag = ? AND chunk_id IN ({placeholders})", chunk_ids, params=(tag,)))
+        is_new = []
+        rows = []
+        for chunk_hash, (_, source, tag, metadata) in zip(hashes, items):
+            key = (ids[chunk_hash], tag)
+            new = key not in linked
+            is_new.append(new)
+            if new:
+                linked.add(key)
+                rows.append((ids[chunk_hash], tag, source, json.dumps(metadata) if metadata else None))
+        if rows:
+            c.executemany("INSERT INTO chunk_tags (chunk_id, tag, source, metadata) VALUES (?, ?, ?, ?)", rows)
+            for tag in {row[1] for row in rows}:
+                _bump_collection_version(c, tag)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"Debug: Added {len(rows)} new chunks of {len(items)} ({len(new_chunks)} with new text, "
+          f"{len(items) - len(rows)} duplicates or already stored).")
+    return is_new
+
+def add_chunk_if_new(conn, content, source, tag=None, metadata=None):
+    return add_chunks_if_new(conn, [(content, source, tag, metadata)])[0]
+
+def remove_chunk_tags(conn, tag, contents):
+    """
+    Undo add_chunks_if_new for chunks that never reached the tag's vectorstore, so a later run sees them as new
+    again. The chunk text itself stays stored; it may belong to other collections.
+    """
+    if not contents:
+        return
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        ids = list(_chunk_ids(c, list(set(_hash_chunks(contents)))).values())
+        _chunked_in_query(c, "DELETE FROM chunk_tags WHERE tag = ? AND chunk_id IN ({placeholders})", ids, params=(tag,))
+        _bump_collection_version(c, tag)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"Debug: Removed {len(ids)} unindexed chunks from tag '{tag}'.")
+
+def search_chunks_bm25(conn, query, tags, k=5):
+    """Top-k (content, source, tag) rows by BM25 over one tag or a list of tags. All tags share one FTS index,
+    so scores are comparable across them; a chunk present in several of the tags is returned once."""
+    if isinstance(tags, str):
+        tags = [tags]
+    # Quote each term so user text can't inject FTS5 query syntax; OR them like a bag-of-words BM25 query
+    terms = re.findall(r"\w+", query.lower())
+    if not terms or not tags:
+        return []
+    match_expr = " OR ".join(f'"{term}"' for term in terms)
+    placeholders = ",".join("?" * len(tags))
+    c = conn.cursor()
+    # CROSS JOIN keeps the full-text match as the outer loop, which bm25() requires
+    c.execute("SELECT chunks.id, chunks.content, chunk_tags.source, chunk_tags.tag FROM chunks_fts "
+              "CROSS JOIN chunks ON chunks.id = chunks_fts.rowid "
+              f"CROSS JOIN chunk_tags ON chunk_tags.chunk_id = chunks.id AND chunk_tags.tag IN ({placeholders}) "
+              "WHERE chunks_fts MATCH ? ORDER BY bm25(chunks_fts) LIMIT ?", (*tags, match_expr, k * len(tags)))
+    rows = []
+    seen = set()
+    for chunk_id, content, source, tag in c.fetchall():
+        if chunk_id not in seen and len(rows) < k:
+            seen.add(chunk_id)
+            rows.append((content, source, tag))
+    print(f"Debug: BM25 search for tags {tags} returned {len(rows)} chunks.")
+    return rows
 
 def get_unique_tags(conn):
-    with lock:
-        c = conn.cursor()
-        c.execute("SELECT DISTINCT tag FROM chunks WHERE tag IS NOT NULL")
-        tags = [row[0] for row in c.fetchall()]
+    # Skip-scan the (tag, chunk_id) key: one index seek per tag instead of a pass over every chunk
+    c = conn.cursor()
+    c.execute('''WITH RECURSIVE tags (tag) AS (
+                     SELECT MIN(tag) FROM chunk_tags
+                     UNION ALL
+                     SELECT (SELECT MIN(tag) FROM chunk_tags WHERE tag > tags.tag) FROM tags WHERE tags.tag IS NOT NULL)
+                 SELECT tag FROM tags WHERE tag IS NOT NULL''')
+    tags = [row[0] for row in c.fetchall()]
     return tags
 
+def get_tag_chunks(conn, tag):
+    c = conn.cursor()
+    c.execute("SELECT id, hash, content, source, tag, metadata FROM tagged_chunks WHERE tag = ?", (tag,))
+    return c.fetchall()
+
 def add_collection(conn, name, tag):
-    with lock:
-        c = conn.cursor()
-        c.execute("INSERT OR IGNORE INTO collections (name, tag) VALUES (?, ?)", (name, tag))
-        conn.commit()
+    c = conn.cursor()
+    c.execute("INSERT OR IGNORE INTO collections (name, tag) VALUES (?, ?)", (name, tag))
+    conn.commit()
 
 def get_collections(conn):
-    with lock:
-        c = conn.cursor()
-        c.execute("SELECT name, tag FROM collections")
-        collections = [{'name': row[0], 'tag': row[1]} for row in c.fetchall()]
+    c = conn.cursor()
+    c.execute("SELECT name, tag FROM collections")
+    collections = [{'name': row[0], 'tag': row[1]} for row in c.fetchall()]
     return collections
 
 def rename_collection(conn, old_name, new_name):
-    with lock:
-        c = conn.cursor()
-        c.execute("UPDATE collections SET name = ? WHERE name = ?", (new_name, old_name))
-        conn.commit()
+    c = conn.cursor()
+    c.execute("UPDATE collections SET name = ? WHERE name = ?", (new_name, old_name))
+    conn.commit()
     print(f"Debug: Renamed collection from {old_name} to {new_name}")
 
 def delete_collection(conn, name, tag):
-    with lock:
-        c = conn.cursor()
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
         c.execute("DELETE FROM collections WHERE name = ?", (name,))
-        c.execute("DELETE FROM chunks WHERE tag = ?", (tag,))
+        c.execute("CREATE TEMP TABLE IF NOT EXISTS deleted_chunk_ids (id INTEGER PRIMARY KEY)")
+        c.execute("DELETE FROM deleted_chunk_ids")
+        c.execute("INSERT INTO deleted_chunk_ids SELECT chunk_id FROM chunk_tags WHERE tag = ?", (tag,))
+        c.execute("DELETE FROM chunk_tags WHERE tag = ?", (tag,))
+        # Text still linked to another collection stays; the rest leaves chunks and the full-text index
+        c.execute("DELETE FROM deleted_chunk_ids WHERE EXISTS (SELECT 1 FROM chunk_tags WHERE chunk_id = deleted_chunk_ids.id)")
+        c.execute("INSERT INTO chunks_fts (chunks_fts, rowid, content) "
+                  "SELECT 'delete', id, content FROM chunks WHERE id IN (SELECT id FROM deleted_chunk_ids)")
+        c.execute("DELETE FROM chunks WHERE id IN (SELECT id FROM deleted_chunk_ids)")
+        _bump_collection_version(c, tag)
         conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
     # Delete FAISS folder
+    evict_vectorstore(tag)
     tag_path = os.path.join(FAISS_PATH, tag)
-    if os.path.exists(tag_path):
-        shutil.rmtree(tag_path)
+    with get_collection_lock(tag).write():
+        if os.path.exists(tag_path):
+            shutil.rmtree(tag_path)
     print(f"Debug: Deleted collection {name} with tag {tag}")
\ No newline at end of file
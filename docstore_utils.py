@@ -0,0 +1,34 @@
+# docstore_utils.py
+import json
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+from utils import get_connection
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Docstore that keeps no chunk text in memory. Docstore ids are chunk hashes, and text and metadata are
+    read on demand from crawled.db, which ingestion fills via add_chunks_if_new before indexing."""
+
+    def __init__(self, tag):
+        self.tag = tag
+
+    def search(self, search):
+        # Searches run on chat and retrieval threads concurrently; each reads through its own thread's connection
+        c = get_connection().cursor()
+        c.execute("SELECT chunks.content, chunk_tags.source, chunk_tags.tag, chunk_tags.metadata FROM chunks "
+                  "JOIN chunk_tags ON chunk_tags.chunk_id = chunks.id AND chunk_tags.tag = ? WHERE chunks.hash = ?",
+                  (self.tag, search))
+        row = c.fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        content, source, tag, metadata = row
+        metadata = json.loads(metadata) if metadata else {"source": source, "tag": tag or self.tag}
+        return Document(page_content=content, metadata=metadata)
+
+    def add(self, texts):
+        # Chunk rows are already in crawled.db by the time they are indexed
+        pass
+
+    def delete(self, ids):
+        # Rows are removed with the collection by db_utils.delete_collection
+        pass
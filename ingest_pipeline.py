@@ -0,0 +1,335 @@
+# ingest_pipeline.py
+import os
+import html
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from urllib.parse import quote
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from config import RAW_DIR, INGEST_QUEUE_SIZE, INGEST_STAGE_WORKERS, EMBEDDING_BATCH_SIZE
+from db_utils import (get_url_freshness, get_stored_contents, store_content, mark_revalidated, add_chunks_if_new,
+                      remove_chunk_tags)
+from vectorstore_manager import embed_texts_batched, add_documents_to_vectorstore
+from utils import get_connection
+
+STAGES = ["source", "fetch", "clean", "chunk", "dedupe", "embed", "index"]
+
+# Per-stage metrics of recent ingestion runs, newest last
+recent_ingestion_stats = deque(maxlen=50)
+
+_DONE = object()
+
+
+class IngestSource:
+    """
+    What a source module supplies to the pipeline: the items to ingest and how to fetch and clean one of them.
+    fetch(item, etag, last_modified) returns (raw, etag, last_modified), with raw None when the server says the
+    stored copy is still current; clean(item, raw, use_ollama, progress) returns the text to store and chunk,
+    reporting long work (e.g. Ollama augmentation) through progress(message). key(item) is
+    the URL or path the text is stored under and raw_name(item) the name its raw files are saved under, chunk(text)
+    splits it (500-character chunks by default), and metadata(item) adds fields to each chunk's metadata.
+    """
+
+    def __init__(self, kind, items, fetch, clean=None, key=None, chunk=None, metadata=None, reuse_stored=True,
+                 fetch_workers=None, clean_workers=None, raw_title="Processed Text", raw_name=None):
+        self.kind = kind
+        self.items = list(items)
+        self.fetch = fetch
+        self.clean = clean or (lambda item, raw, use_ollama, progress=None: raw)
+        self.key = key or (lambda item: item)
+        self.chunk = chunk or default_chunker
+        self.metadata = metadata or (lambda item: {})
+        self.reuse_stored = reuse_stored
+        self.workers = {"fetch": fetch_workers, "clean": clean_workers}
+        self.raw_title = raw_title
+        self.raw_name = raw_name or self.key
+
+
+def default_chunker(text):
+    return RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100).split_text(text)
+
+
+def write_raw_files(name, text, use_ollama, title):
+    """Save text as a .txt download and an .html view in RAW_DIR; returns the .txt path."""
+    prefix = "ollama_" if use_ollama else ""
+    safe_filename = prefix + quote(name.replace("https://", "").replace("http://", "").replace("/", "_")[:100]) + ".txt"
+    filepath = os.path.join(RAW_DIR, safe_filename)
+    with open(filepath, "w", encoding="utf-8") as f:
+        f.write(text)
+    html_filepath = os.path.join(RAW_DIR, safe_filename.replace(".txt", ".html"))
+    escaped_text = html.escape(text)
+    html_content = f"""
+<html>
+<head>
+    <style>
+        body {{ font-family: sans-serif; padding: 20px; line-height: 1.6; max-width: 800px; margin: auto; }}
+        pre {{ white-space: pre-wrap; word-wrap: break-word; }}
+    </style>
+</head>
+<body>
+    <h1>{title} for {name}</h1>
+    <pre>{escaped_text}</pre>
+</body>
+</html>
+"""
+    with open(html_filepath, "w", encoding="utf-8") as f:
+        f.write(html_content)
+    return filepath
+
+
+class Stage:
+    """A pool of worker threads applying fn to items from inbox and putting each returned output on outbox.
+    Queues are bounded, so a slow stage blocks its upstream (backpressure) instead of buffering everything.
+    flush(), if given, is called once after the last input and its outputs are passed on before the end marker."""
+
+    def __init__(self, name, fn, workers, inbox, outbox, flush=None):
+        self.name = name
+        self.fn = fn
+        self.flush = flush
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.outbox = outbox
+        self._lock = threading.Lock()
+        self._running = self.workers
+        self.last_error = None
+        self.metrics = {"stage": name, "workers": self.workers, "in": 0, "out": 0, "errors": 0,
+                        "busy_s": 0.0, "idle_s": 0.0, "blocked_s": 0.0}
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self.metrics[name] += delta
+
+    def _work(self):
+        while True:
+            start = time.perf_counter()
+            item = self.inbox.get()
+            self._count(idle_s=time.perf_counter() - start)
+            if item is _DONE:
+                # Hand the end marker on to sibling workers still waiting on the same queue
+                self.inbox.put(_DONE)
+                break
+            self._count(**{"in": 1})
+            self._run(self.fn, item)
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            if self.flush is not None:
+                self._run(self.flush)
+            if self.outbox is not None:
+                self.outbox.put(_DONE)
+
+    def _run(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            outputs = list(fn(*args))
+        except Exception as e:
+            outputs = []
+            self._count(errors=1)
+            self.last_error = e
+            print(f"Debug: Ingestion stage '{self.name}' failed on an item: {e}")
+        self._count(busy_s=time.perf_counter() - start)
+        for output in outputs:
+            start = time.perf_counter()
+            if self.outbox is not None:
+                self.outbox.put(output)
+            self._count(out=1, blocked_s=time.perf_counter() - start)
+
+    def start(self):
+        self.threads = [threading.Thread(target=self._work, name=f"ingest-{self.name}-{i}", daemon=True)
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+
+def run_ingestion(tag, source, use_ollama=False, progress=None, cancelled=None):
+    """
+    Stream source.items through source -> fetch -> clean -> chunk -> dedupe -> embed -> index, all stages running
+    concurrently on their own workers. New chunks of all items are embedded and added in EMBEDDING_BATCH_SIZE
+    batches. Once cancelled() returns True no further items are started; items already past the source stage are
+    finished. Returns {"contents": {key: text}, "new_chunks", "failed": [keys],
+    "cancelled", "stages": [metrics]}.
+    """
+    total = len(source.items)
+    contents = {}
+    failed = []
+    new_chunks = [0]
+    done = [0]
+    state_lock = threading.Lock()
+    pending_docs = []
+    # Set once dedupe, embed or index fails: nothing more is indexed, and chunks already recorded for the tag but
+    # not indexed are removed again, or every later run would skip them as duplicates
+    halted = threading.Event()
+    keys = [source.key(item) for item in source.items]
+    freshness = get_url_freshness(get_connection(), keys) if source.reuse_stored else {}
+    stored = get_stored_contents(get_connection(), [key for key in keys if freshness.get(key, {}).get("fresh")])
+
+    def report(key, ok):
+        with state_lock:
+            done[0] += 1
+            if not ok:
+                failed.append(key)
+            message = f"Fetched and cleaned {done[0]}/{total}: {key}" + ("" if ok else " (failed)")
+        print(f"Debug: {message}")
+        if progress:
+            progress(message)
+
+    def item_progress(key):
+        def note(message):
+            print(f"Debug: {key}: {message}")
+            if progress:
+                progress(f"{key}: {message}")
+        return note
+
+    def stopped():
+        return halted.is_set() or bool(cancelled and cancelled())
+
+    def source_stage(item):
+        if stopped():
+            return
+        key = source.key(item)
+        yield {"item": item, "key": key, "info": freshness.get(key, {}), "text": stored.get(key), "raw": None}
+
+    def fetch_stage(work):
+        if work["text"] is None:
+            key = work["key"]
+            info = work["info"]
+            try:
+                raw, etag, last_modified = source.fetch(work["item"], info.get("etag"), info.get("last_modified"))
+                if raw is None:
+                    work["text"] = get_stored_contents(get_connection(), [key]).get(key)
+                    if work["text"] is None:
+                        # Not modified, but the stored copy is gone: fetch it again without validators
+                        print(f"Debug: {key} was not modified but has no stored content. Refetching.")
+                        raw, etag, last_modified = source.fetch(work["item"], None, None)
+                    else:
+                        mark_revalidated(get_connection(), key, etag, last_modified)
+                if raw is not None:
+                    work.update(raw=raw, etag=etag, last_modified=last_modified)
+            except Exception:
+                report(key, False)
+                raise
+        yield work
+
+    def clean_stage(work):
+        key = work["key"]
+        try:
+            if work["text"] is None and work["raw"]:
+                text = source.clean(work["item"], work["raw"], use_ollama, progress=item_progress(key))
+                if text:
+                    store_content(get_connection(), key, text, etag=work.get("etag"), last_modified=work.get("last_modified"))
+                    write_raw_files(source.raw_name(work["item"]), text, use_ollama, source.raw_title)
+                work["text"] = text
+        finally:
+            report(key, bool(work["text"]))
+        if work["text"]:
+            with state_lock:
+                contents[key] = work["text"]
+            yield work
+
+    def chunk_stage(work):
+        metadata = dict(source.metadata(work["item"]), source=work["key"], tag=tag)
+        yield [(chunk, work["key"], tag, dict(metadata)) for chunk in source.chunk(work["text"])]
+
+    def discard(docs):
+        remove_chunk_tags(get_connection(), tag, [doc.page_content for doc in docs])
+
+    def dedupe_stage(items):
+        if halted.is_set():
+            return
+        try:
+            is_new = add_chunks_if_new(get_connection(), items)
+        except Exception:
+            halted.set()
+            raise
+        docs = [Document(page_content=chunk, metadata=metadata) for (chunk, _, _, metadata), new in zip(items, is_new) if new]
+        if docs:
+            yield docs
+
+    def embed_batches(batches):
+        if halted.is_set():
+            for docs in batches:
+                discard(docs)
+            return []
+        try:
+            return [(docs, embed_texts_batched([doc.page_content for doc in docs])) for docs in batches]
+        except Exception:
+            # None of these batches reaches the index stage
+            halted.set()
+            for docs in batches:
+                discard(docs)
+            raise
+
+    def embed_stage(docs):
+        # Gather chunks across items so small pages share embedding calls and log writes
+        batches = []
+        with state_lock:
+            pending_docs.extend(docs)
+            while len(pending_docs) >= EMBEDDING_BATCH_SIZE:
+                batches.append(pending_docs[:EMBEDDING_BATCH_SIZE])
+                del pending_docs[:EMBEDDING_BATCH_SIZE]
+        return embed_batches(batches)
+
+    def embed_flush():
+        with state_lock:
+            batch = list(pending_docs)
+            pending_docs.clear()
+        return embed_batches([batch] if batch else [])
+
+    def index_stage(batch):
+        docs, vectors = batch
+        if halted.is_set():
+            discard(docs)
+            return []
+        try:
+            add_documents_to_vectorstore(tag, docs, vectors=vectors)
+        except Exception:
+            halted.set()
+            discard(docs)
+            raise
+        with state_lock:
+            new_chunks[0] += len(docs)
+        return []
+
+    functions = {"source": source_stage, "fetch": fetch_stage, "clean": clean_stage, "chunk": chunk_stage,
+                 "dedupe": dedupe_stage, "embed": embed_stage, "index": index_stage}
+    queues = [queue.Queue(maxsize=INGEST_QUEUE_SIZE) for _ in STAGES]
+    stages = []
+    for i, name in enumerate(STAGES):
+        workers = source.workers.get(name) or INGEST_STAGE_WORKERS[name]
+        stages.append(Stage(name, functions[name], workers, queues[i], queues[i + 1] if i + 1 < len(STAGES) else None,
+                            flush=embed_flush if name == "embed" else None))
+
+    start = time.perf_counter()
+    for stage in stages:
+        stage.start()
+    # Feeding blocks once the source stage falls behind, like every other hand-off
+    for item in source.items:
+        if stopped():
+            break
+        queues[0].put(item)
+    queues[0].put(_DONE)
+    for stage in stages:
+        stage.join()
+    elapsed = time.perf_counter() - start
+
+    # A bad page only fails its own item; a failure from dedupe on fails the whole ingestion (its unindexed chunks
+    # were removed from the tag above, so a retry picks them up)
+    for stage in stages[STAGES.index("dedupe"):]:
+        if stage.last_error is not None:
+            raise ValueError(f"Ingestion into '{tag}' failed in the {stage.name} stage: {stage.last_error}")
+    metrics = [dict(stage.metrics) for stage in stages]
+    recent_ingestion_stats.append({"time": datetime.now().isoformat(timespec="seconds"), "tag": tag, "kind": source.kind,
+                                   "items": total, "new_chunks": new_chunks[0], "elapsed_s": elapsed, "stages": metrics})
+    print(f"Debug: Ingested {total} {source.kind} items into '{tag}' in {elapsed:.1f}s: {new_chunks[0]} new chunks. "
+          + ", ".join(f"{m['stage']} busy {m['busy_s']:.1f}s/blocked {m['blocked_s']:.1f}s" for m in metrics))
+    return {"contents": contents, "new_chunks": new_chunks[0], "failed": failed,
+            "cancelled": bool(cancelled and cancelled()), "stages": metrics}
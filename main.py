@@ -9,26 +9,38 @@ from youtube_utils import start_youtube_collection
 from reddit_utils import start_reddit_collection
 from subreddit_utils import start_subreddit_collection
 from file_utils import start_file_ingestion
-from view_utils import view_db, execute_sql_query, view_vectorstore, perform_similarity_search, refresh_tasks, show_task_detail, view_available_tags
-from config import MODEL_NAME
+from view_utils import view_db, execute_sql_query, view_vectorstore, perform_similarity_search, refresh_tasks, show_task_detail, view_available_tags, view_lock_stats, view_ingestion_stats
+from utils import connect_db, get_connection
+from config import MODEL_NAME, WARMUP_RESOURCES, RERANK_ENABLED
+from resource_utils import warm_up
+from task_utils import start_scheduler, cancel_task, set_task_priority
 import pandas as pd
 
-conn = init_db()
+# Callbacks run on Gradio worker threads, so each uses its thread's connection instead of one shared handle
+init_db().close()
+# Picks up tasks queued or interrupted before a restart
+start_scheduler()
 
 def load_completed_collections():
-    return get_collections(conn)
+    return get_collections(get_connection())
 
 def update_dropdown():
     completed_collections = load_completed_collections()
     print("Debug: Loaded collections:", completed_collections)  # Debug
-    return gr.update(choices=["No RAG"] + [c['name'] for c in completed_collections], value="No RAG"), completed_collections
+    return gr.update(choices=[c['name'] for c in completed_collections], value=[]), completed_collections
 
 def submit_chat(m, h, s, completed_collections):
-    tag = next((c['tag'] for c in completed_collections if c['name'] == s), None) if s != "No RAG" else None
-    print(f"Debug: Submitting chat with source: {s}, tag: {tag}")  # Debug
-    gen = chat_bot(m, h, conn=conn, selected_source=s, selected_tag=tag)
-    for chat_out, msg_out in gen:
-        yield chat_out, msg_out
+    selected = set(s or [])
+    tags = [c['tag'] for c in completed_collections if c['name'] in selected]
+    print(f"Debug: Submitting chat with sources: {s}, tags: {tags}")  # Debug
+    # Generator steps may resume on different worker threads, so the turn owns a connection rather than a thread
+    conn = connect_db()
+    try:
+        gen = chat_bot(m, h, conn=conn, selected_tags=tags)
+        for chat_out, msg_out in gen:
+            yield chat_out, msg_out
+    finally:
+        conn.close()
 
 def toggle_youtube_inputs(mode):
     if mode == "Search Query":
@@ -46,7 +58,7 @@ def select_data_source(selected_row, collections):
         return "", pd.DataFrame()
     name = selected_row['name']
     tag = selected_row['tag']
-    chunks_df = pd.read_sql(f"SELECT * FROM chunks WHERE tag = '{tag}'", conn)
+    chunks_df = pd.read_sql("SELECT * FROM tagged_chunks WHERE tag = ?", get_connection(), params=(tag,))
     return name, chunks_df
 
 def rename_data_source(selected_row, new_name, collections):
@@ -54,7 +66,7 @@ def rename_data_source(selected_row, new_name, collections):
         return "No source selected"
     old_name = selected_row['name']
     tag = selected_row['tag']
-    rename_collection(conn, old_name, new_name)
+    rename_collection(get_connection(), old_name, new_name)
     # Update state
     for c in collections:
         if c['name'] == old_name:
@@ -66,7 +78,7 @@ def confirm_delete_data_source(selected_row, collections):
         return "No source selected"
     name = selected_row['name']
     tag = selected_row['tag']
-    delete_collection(conn, name, tag)
+    delete_collection(get_connection(), name, tag)
     # Update state
     collections = [c for c in collections if c['name'] != name]
     return "Deleted successfully. Refresh to see changes."
@@ -74,13 +86,12 @@ def confirm_delete_data_source(selected_row, collections):
 with gr.Blocks(title="Enhanced RAG Chatbot with Qwen 2.5:7B", theme=gr.themes.Soft()) as demo:
     gr.Markdown(f"# Enhanced RAG Chatbot\nCurrent Model: {MODEL_NAME}")
     
-    collection_tasks_state = gr.State([])
     completed_collections_state = gr.State([])
     
     with gr.Tabs():
         with gr.Tab("Chat"):
-            gr.Markdown("""**Instructions:** Select a RAG source below to augment your query with pre-collected data.""")
-            source_dropdown = gr.Dropdown(label="Select RAG Source (optional)", choices=[], value=None, interactive=True)
+            gr.Markdown("""**Instructions:** Select one or more RAG sources below to augment your query with pre-collected data. Leave empty to chat without RAG.""")
+            source_dropdown = gr.Dropdown(label="Select RAG Sources (optional)", choices=[], value=[], multiselect=True, interactive=True)
             refresh_sources_btn = gr.Button("Refresh Sources")
             chatbot = gr.Chatbot(height=500, type="messages")
             msg = gr.Textbox(placeholder="Enter your prompt here...", show_label=False)
@@ -99,9 +110,10 @@ with gr.Blocks(title="Enhanced RAG Chatbot with Qwen 2.5:7B", theme=gr.themes.So
             timelimit_input_web = gr.Dropdown(["Day", "Week", "Month", "Year"], label="Time Limit")
             max_urls_input_web = gr.Number(label="Max URLs", value=10)
             use_ollama_web = gr.Checkbox(label="Use Ollama Augmentation", value=False)
+            priority_web = gr.Number(label="Priority (higher runs first)", value=0, precision=0)
             collect_btn_web = gr.Button("Start Collection")
             status_web = gr.Textbox(label="Status")
-            collect_btn_web.click(lambda n, q, tl, mu, u, ts, cs: start_web_collection(n, q, tl, mu, u, ts, cs), [name_input_web, query_input_web, timelimit_input_web, max_urls_input_web, use_ollama_web, collection_tasks_state, completed_collections_state], [status_web, collection_tasks_state, completed_collections_state])
+            collect_btn_web.click(start_web_collection, [name_input_web, query_input_web, timelimit_input_web, max_urls_input_web, use_ollama_web, priority_web], status_web)
         
         with gr.Tab("YouTube Collection"):
             name_input_yt = gr.Textbox(label="Data Source Name (optional)")
@@ -110,10 +122,11 @@ with gr.Blocks(title="Enhanced RAG Chatbot with Qwen 2.5:7B", theme=gr.themes.So
             urls_input_yt = gr.TextArea(label="List of URLs (one per line)", visible=False)
             max_videos_input_yt = gr.Number(label="Max Videos", value=10)
             use_ollama_yt = gr.Checkbox(label="Use Ollama Augmentation", value=False)
+            priority_yt = gr.Number(label="Priority (higher runs first)", value=0, precision=0)
             collect_btn_yt = gr.Button("Start Collection")
             status_yt = gr.Textbox(label="Status")
             mode_yt.change(toggle_youtube_inputs, mode_yt, [query_input_yt, urls_input_yt])
-            collect_btn_yt.click(lambda n, m, q, urls, mv, u, ts, cs: start_youtube_collection(n, m, q if m == "Search Query" else None, urls.splitlines() if m == "List of URLs" else None, mv, u, ts, cs), [name_input_yt, mode_yt, query_input_yt, urls_input_yt, max_videos_input_yt, use_ollama_yt, collection_tasks_state, completed_collections_state], [status_yt, collection_tasks_state, completed_collections_state])
+            collect_btn_yt.click(lambda n, m, q, urls, mv, u, p: start_youtube_collection(n, m, q if m == "Search Query" else None, urls.splitlines() if m == "List of URLs" else None, mv, u, p), [name_input_yt, mode_yt, query_input_yt, urls_input_yt, max_videos_input_yt, use_ollama_yt, priority_yt], status_yt)
         
         with gr.Tab("Reddit Collection"):
             name_input_reddit = gr.Textbox(label="Data Source Name (optional)")
@@ -122,9 +135,10 @@ with gr.Blocks(title="Enhanced RAG Chatbot with Qwen 2.5:7B", theme=gr.themes.So
             max_urls_input_reddit = gr.Number(label="Max URLs", value=10)
             use_ollama_reddit = gr.Checkbox(label="Use Ollama Augmentation", value=False)
             max_comments_reddit = gr.Number(label="Max Comments per Thread", value=50)
+            priority_reddit = gr.Number(label="Priority (higher runs first)", value=0, precision=0)
             collect_btn_reddit = gr.Button("Start Collection")
             status_reddit = gr.Textbox(label="Status")
-            collect_btn_reddit.click(lambda n, q, tl, mu, u, mc, ts, cs: start_reddit_collection(n, q, tl, mu, u, mc, ts, cs), [name_input_reddit, query_input_reddit, timelimit_input_reddit, max_urls_input_reddit, use_ollama_reddit, max_comments_reddit, collection_tasks_state, completed_collections_state], [status_reddit, collection_tasks_state, completed_collections_state])
+            collect_btn_reddit.click(start_reddit_collection, [name_input_reddit, query_input_reddit, timelimit_input_reddit, max_urls_input_reddit, use_ollama_reddit, max_comments_reddit, priority_reddit], status_reddit)
         
         with gr.Tab("Subreddit Collection"):
             name_input_sub = gr.Textbox(label="Data Source Name (optional)")
@@ -134,29 +148,39 @@ with gr.Blocks(title="Enhanced RAG Chatbot with Qwen 2.5:7B", theme=gr.themes.So
             max_urls_input_sub = gr.Number(label="Max URLs", value=10)
             use_ollama_sub = gr.Checkbox(label="Use Ollama Augmentation", value=False)
             max_comments_sub = gr.Number(label="Max Comments per Thread", value=50)
+            priority_sub = gr.Number(label="Priority (higher runs first)", value=0, precision=0)
             collect_btn_sub = gr.Button("Start Collection")
             status_sub = gr.Textbox(label="Status")
-            collect_btn_sub.click(lambda n, s, tl, q, mu, u, mc, ts, cs: start_subreddit_collection(n, s, tl, q, mu, u, mc, ts, cs), [name_input_sub, subreddit_input, timelimit_input_sub, query_input_sub, max_urls_input_sub, use_ollama_sub, max_comments_sub, collection_tasks_state, completed_collections_state], [status_sub, collection_tasks_state, completed_collections_state])
+            collect_btn_sub.click(start_subreddit_collection, [name_input_sub, subreddit_input, timelimit_input_sub, query_input_sub, max_urls_input_sub, use_ollama_sub, max_comments_sub, priority_sub], status_sub)
         
         with gr.Tab("File Ingestion"):
             name_input_file = gr.Textbox(label="Data Source Name (optional)")
             file_upload = gr.File(label="Upload TXT or PDF file", file_types=['.txt', '.pdf'], type="filepath")
             use_ollama_file = gr.Checkbox(label="Use Ollama Augmentation", value=False)
+            priority_file = gr.Number(label="Priority (higher runs first)", value=0, precision=0)
             ingest_btn = gr.Button("Start Ingestion")
             status_file = gr.Textbox(label="Status")
-            ingest_btn.click(lambda n, fp, u, ts, cs: start_file_ingestion(n, fp, u, ts, cs), [name_input_file, file_upload, use_ollama_file, collection_tasks_state, completed_collections_state], [status_file, collection_tasks_state, completed_collections_state])
+            ingest_btn.click(start_file_ingestion, [name_input_file, file_upload, use_ollama_file, priority_file], status_file)
         
         with gr.Tab("Tasks"):
             refresh_btn = gr.Button("Refresh Tasks")
             tasks_df = gr.Dataframe(label="Tasks")
+            task_id_input = gr.Number(label="Task ID", precision=0)
+            with gr.Row():
+                cancel_task_btn = gr.Button("Cancel Task")
+                new_priority_input = gr.Number(label="New Priority", value=0, precision=0)
+                set_priority_btn = gr.Button("Set Priority of Queued Task")
+            task_action_status = gr.Textbox(label="Task Action Status")
             with gr.Accordion("Task Detail", open=False):
-                task_id_input = gr.Number(label="Task ID")
                 view_detail_btn = gr.Button("View Detail")
                 detail_content = gr.Markdown(label="Scraped Content")
                 detail_summary = gr.Markdown(label="LLM Summarization")
                 detail_answer = gr.Markdown(label="Answer to Search Query")
-            refresh_btn.click(refresh_tasks, collection_tasks_state, tasks_df)
-            view_detail_btn.click(lambda tid, ts: show_task_detail(tid, ts, conn), [task_id_input, collection_tasks_state], [detail_content, detail_summary, detail_answer])
+            demo.load(refresh_tasks, outputs=tasks_df)
+            refresh_btn.click(refresh_tasks, outputs=tasks_df)
+            cancel_task_btn.click(lambda tid: cancel_task(int(tid)) if tid is not None else "Enter a task ID.", task_id_input, task_action_status).then(refresh_tasks, outputs=tasks_df)
+            set_priority_btn.click(lambda tid, p: set_task_priority(int(tid), p) if tid is not None else "Enter a task ID.", [task_id_input, new_priority_input], task_action_status).then(refresh_tasks, outputs=tasks_df)
+            view_detail_btn.click(lambda tid: show_task_detail(tid, get_connection()), task_id_input, [detail_content, detail_summary, detail_answer])
         
         with gr.Tab("View Database"):
             sources_df = gr.Dataframe(label="Available Data Sources", interactive=True)
@@ -179,18 +203,27 @@ with gr.Blocks(title="Enhanced RAG Chatbot with Qwen 2.5:7B", theme=gr.themes.So
             load_db_btn = gr.Button("Load Database Contents")
             urls_df = gr.Dataframe(label="URLs Table")
             chunks_df = gr.Dataframe(label="Chunks Table")
-            load_db_btn.click(lambda: view_db(conn), outputs=[urls_df, chunks_df])
+            load_db_btn.click(lambda: view_db(get_connection()), outputs=[urls_df, chunks_df])
             sql_query_input = gr.Textbox(label="Custom SQL Query (e.g., SELECT * FROM urls LIMIT 5)")
             execute_query_btn = gr.Button("Execute Query")
             query_output = gr.Markdown(label="Query Results")
             query_error = gr.Textbox(label="Error")
-            execute_query_btn.click(lambda q: execute_sql_query(conn, q), sql_query_input, [query_output, query_error])
+            execute_query_btn.click(lambda q: execute_sql_query(get_connection(), q), sql_query_input, [query_output, query_error])
             show_vs_btn = gr.Button("Show Vector Store Contents")
             vs_output = gr.Markdown(label="Vector Store Entries")
             show_vs_btn.click(view_vectorstore, outputs=vs_output)
             similarity_query_input = gr.Textbox(label="Similarity Search Query")
             similarity_search_btn = gr.Button("Perform Similarity Search")
             similarity_results = gr.Markdown(label="Similarity Search Results")
-            similarity_search_btn.click(perform_similarity_search, similarity_query_input, similarity_results)
+            similarity_shards_df = gr.Dataframe(label="Per-Collection Latency")
+            similarity_search_btn.click(perform_similarity_search, similarity_query_input, [similarity_results, similarity_shards_df])
+            lock_stats_btn = gr.Button("Show Lock Wait Stats")
+            lock_stats_df = gr.Dataframe(label="Lock Waits")
+            lock_stats_btn.click(view_lock_stats, outputs=lock_stats_df)
+            ingestion_stats_btn = gr.Button("Show Ingestion Stage Metrics")
+            ingestion_stats_df = gr.Dataframe(label="Ingestion Stages (busy = working, idle = waiting for input, blocked = waiting on a full downstream queue)")
+            ingestion_stats_btn.click(view_ingestion_stats, outputs=ingestion_stats_df)
 
+# Models load on first use; start loading them now so the first chat or ingestion doesn't pay for it
+warm_up(WARMUP_RESOURCES + (["reranker"] if RERANK_ENABLED else []))
 demo.queue(default_concurrency_limit=5).launch()
\ No newline at end of file
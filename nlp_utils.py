@@ -0,0 +1,91 @@
+# nlp_utils.py
+import re
+from config import SPACY_MODEL, NLP_SEGMENT_CHARS, NLP_BATCH_SIZE, NLP_PROCESSES, NLP_PARALLEL_MIN_CHARS
+from resource_utils import register_resource, get_resource
+
+# en_core_web_sm's ner has its own internal tok2vec, so everything else can be left out of the entity pipeline
+NER_EXCLUDE = ["tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer"]
+
+
+# spaCy itself is imported inside the loaders; importing it costs about a second even before any model is loaded
+def _build_sentencizer():
+    import spacy
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    # Texts are fed in segments of at most NLP_SEGMENT_CHARS, so this only guards direct calls
+    nlp.max_length = max(nlp.max_length, NLP_SEGMENT_CHARS)
+    return nlp
+
+
+def _build_ner():
+    import spacy
+    return spacy.load(SPACY_MODEL, exclude=NER_EXCLUDE)
+
+
+register_resource("sentencizer", _build_sentencizer)
+register_resource("ner", _build_ner)
+
+
+def get_sentencizer():
+    """Rule-based sentence splitter; no model weights, tagger or parser."""
+    return get_resource("sentencizer")
+
+
+def get_ner():
+    """Entity recognizer from SPACY_MODEL with every other component excluded."""
+    return get_resource("ner")
+
+
+def iter_segments(text, max_chars=NLP_SEGMENT_CHARS):
+    """Split text into pieces of at most max_chars, preferring paragraph, then line, then sentence, then word breaks."""
+    start = 0
+    while len(text) - start > max_chars:
+        window = text[start:start + max_chars]
+        cut = -1
+        for pattern in (r"\n\s*\n", r"\n", r"[.!?]\s", r"\s"):
+            matches = list(re.finditer(pattern, window[max_chars // 2:]))
+            if matches:
+                cut = max_chars // 2 + matches[-1].end()
+                break
+        if cut <= 0:
+            cut = max_chars
+        yield text[start:start + cut]
+        start += cut
+    if start < len(text):
+        yield text[start:]
+
+
+def iter_sentences(text):
+    """Yield stripped sentences of text, streaming it through the sentencizer in segments via nlp.pipe."""
+    nlp = get_sentencizer()
+    segments = iter_segments(text)
+    # Worker processes only pay off once there are several segments to hand out
+    n_process = NLP_PROCESSES if len(text) >= NLP_PARALLEL_MIN_CHARS else 1
+    for doc in nlp.pipe(segments, batch_size=NLP_BATCH_SIZE, n_process=n_process):
+        for sent in doc.sents:
+            sentence = sent.text.strip()
+            if sentence:
+                yield sentence
+
+
+def sentence_chunks(text, chunk_size=200):
+    """Group consecutive sentences into chunks of about chunk_size words."""
+    chunks = []
+    current_chunk = []
+    current_word_count = 0
+    for sent in iter_sentences(text):
+        word_count = len(sent.split())
+        if current_chunk and current_word_count + word_count > chunk_size:
+            chunks.append(' '.join(current_chunk))
+            current_chunk = [sent]
+            current_word_count = word_count
+        else:
+            current_chunk.append(sent)
+            current_word_count += word_count
+    if current_chunk:
+        chunks.append(' '.join(current_chunk))
+    return chunks
+
+
+def extract_entities(text):
+    return [ent.text for ent in get_ner()(text).ents]
@@ -0,0 +1,26 @@
+# reembed.py
+# Migrate saved collections to the embedder configured in config.py.
+# Usage: python reembed.py [tag ...]   (no tags = every collection under FAISS_PATH)
+import os
+import sys
+from config import FAISS_PATH
+from vectorstore_manager import reembed_collection, collection_index_path
+from db_utils import init_db
+
+def main(tags):
+    # Lazily loaded collections read chunk text from crawled.db, so bring its schema up to date first
+    init_db().close()
+    if not tags:
+        tags = sorted(name for name in os.listdir(FAISS_PATH)
+                      if os.path.exists(collection_index_path(os.path.join(FAISS_PATH, name))))
+    migrated = 0
+    for tag in tags:
+        try:
+            if reembed_collection(tag):
+                migrated += 1
+        except Exception as e:
+            print(f"Error re-embedding collection '{tag}': {e}")
+    print(f"Re-embedded {migrated} of {len(tags)} collections.")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
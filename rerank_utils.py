@@ -0,0 +1,55 @@
+# rerank_utils.py
+import time
+import threading
+from config import RERANK_MODEL, RERANK_DEVICE, RERANK_CANDIDATES, RERANK_TOP_N, RERANK_BATCH_SIZE, RERANK_BUDGET_MS
+from resource_utils import register_resource, get_resource, is_loaded, warm_up
+
+_warm_up_started = False
+_warm_up_lock = threading.Lock()
+
+
+def _build_reranker():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANK_MODEL, device=RERANK_DEVICE, max_length=512)
+
+
+register_resource("reranker", _build_reranker)
+
+
+def _start_warm_up():
+    global _warm_up_started
+    with _warm_up_lock:
+        if not _warm_up_started:
+            _warm_up_started = True
+            warm_up(["reranker"])
+
+
+def rerank(query, docs, top_n=RERANK_TOP_N, budget_ms=RERANK_BUDGET_MS):
+    """Score up to RERANK_CANDIDATES (query, chunk) pairs with the cross-encoder in batches and return
+    (best top_n docs, True). If the model is still loading, or the next batch would overrun the time budget,
+    returns (the first top_n docs in their incoming order, False) instead."""
+    docs = docs[:RERANK_CANDIDATES]
+    if len(docs) <= 1:
+        return docs[:top_n], False
+    if not is_loaded("reranker"):
+        # Never make a chat turn wait for the model download/load
+        _start_warm_up()
+        print("Debug: Reranker still loading; keeping ensemble order.")
+        return docs[:top_n], False
+    model = get_resource("reranker")
+    start = time.perf_counter()
+    deadline = start + budget_ms / 1000
+    scores = []
+    for batch_start in range(0, len(docs), RERANK_BATCH_SIZE):
+        batch = docs[batch_start:batch_start + RERANK_BATCH_SIZE]
+        scores.extend(model.predict([(query, doc.page_content) for doc in batch], batch_size=RERANK_BATCH_SIZE,
+                                    show_progress_bar=False))
+        now = time.perf_counter()
+        per_batch = (now - start) / (batch_start // RERANK_BATCH_SIZE + 1)
+        if len(scores) < len(docs) and now + per_batch > deadline:
+            print(f"Debug: Rerank would exceed its {budget_ms} ms budget after {len(scores)}/{len(docs)} candidates; "
+                  f"keeping ensemble order.")
+            return docs[:top_n], False
+    ranked = sorted(zip(docs, scores), key=lambda pair: pair[1], reverse=True)
+    print(f"Debug: Reranked {len(docs)} candidates to {min(top_n, len(docs))} in {1000 * (time.perf_counter() - start):.0f} ms.")
+    return [doc for doc, _ in ranked[:top_n]], True
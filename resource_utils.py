@@ -0,0 +1,60 @@
+# resource_utils.py
+import time
+import threading
+
+# Heavy models (embedders, spaCy pipelines) are registered here by name and built once, on first use
+_loaders = {}
+_resources = {}
+_load_seconds = {}
+_load_locks = {}
+_registry_lock = threading.Lock()
+
+
+def register_resource(name, loader):
+    """Register a zero-argument loader; nothing is loaded until get_resource(name) is first called."""
+    with _registry_lock:
+        _loaders[name] = loader
+        _load_locks.setdefault(name, threading.Lock())
+
+
+def get_resource(name):
+    if name in _resources:
+        return _resources[name]
+    if name not in _loaders:
+        raise ValueError(f"Unknown resource '{name}'. Registered: {sorted(_loaders)}")
+    # One lock per resource: a slow embedder load doesn't hold up a spaCy pipeline, and concurrent first
+    # callers of the same resource wait for a single load
+    with _load_locks[name]:
+        if name not in _resources:
+            start = time.perf_counter()
+            resource = _loaders[name]()
+            _load_seconds[name] = time.perf_counter() - start
+            _resources[name] = resource
+            print(f"Debug: Loaded resource '{name}' in {_load_seconds[name]:.2f}s")
+    return _resources[name]
+
+
+def is_loaded(name):
+    return name in _resources
+
+
+def get_resource_stats():
+    with _registry_lock:
+        return {name: {"loaded": name in _resources, "load_seconds": _load_seconds.get(name)} for name in sorted(_loaders)}
+
+
+def warm_up(names=None):
+    """Load the given resources (default: all registered) in a background thread and return the thread."""
+    names = list(names if names is not None else _loaders)
+
+    def run():
+        for name in names:
+            try:
+                get_resource(name)
+            except Exception as e:
+                # The first real use loads it again and surfaces the error to the caller
+                print(f"Debug: Warm-up of resource '{name}' failed: {e}")
+
+    thread = threading.Thread(target=run, name="resource-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,46 @@
+# retriever_utils.py
+from typing import List, Optional
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from db_utils import search_chunks_bm25
+from search_utils import federated_search
+from rerank_utils import rerank
+from utils import get_connection
+
+
+class SQLiteBM25Retriever(BaseRetriever):
+    """BM25 retriever backed by the persistent FTS5 index in crawled.db, covering every chunk of the given tags.
+    Queries go through the calling thread's connection, since chains may run retrievers on executor threads."""
+
+    tags: List[str]
+    k: int = 5
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        rows = search_chunks_bm25(get_connection(), query, self.tags, k=self.k)
+        return [Document(page_content=content, metadata={"source": source, "tag": tag}) for content, source, tag in rows]
+
+
+class FederatedRetriever(BaseRetriever):
+    """Dense retriever over several collections, searched in parallel and merged by relevance score."""
+
+    tags: List[str]
+    k: int = 5
+    filter: Optional[dict] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        results, _ = federated_search(query, self.tags, k=self.k, filter=self.filter)
+        return [doc for doc, _ in results]
+
+
+class RerankingRetriever(BaseRetriever):
+    """Over-fetches from base_retriever and keeps the top_n candidates by cross-encoder score, falling back to
+    the base retriever's order when the reranker is unavailable or over its time budget."""
+
+    base_retriever: BaseRetriever
+    top_n: int = 3
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        candidates = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        docs, _ = rerank(query, candidates, top_n=self.top_n)
+        return docs
@@ -0,0 +1,49 @@
+# search_utils.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import SEARCH_MAX_WORKERS
+from vectorstore_manager import get_vectorstore, embeddings
+
+
+def _search_shard(tag, query_vector, k, filter):
+    start = time.perf_counter()
+    try:
+        vs = get_vectorstore(tag)
+        hits = []
+        if vs.index.ntotal:
+            # FAISS returns squared L2 distances, and langchain's 1 - d/sqrt(2) goes negative for any hit with cosine
+            # similarity under ~0.29. 1/(1+d) stays in (0, 1] and keeps distance order, so shards merge correctly
+            hits = [(doc, 1.0 / (1.0 + float(distance))) for doc, distance in
+                    vs.similarity_search_with_score_by_vector(query_vector, k=k, filter=filter)]
+        error = None
+    except Exception as e:
+        # e.g. a collection built with another embedder or a corrupt index; the other shards still answer
+        print(f"Debug: Search of collection '{tag}' failed: {e}")
+        hits, error = [], str(e)
+    return hits, {"tag": tag, "hits": len(hits), "ms": 1000 * (time.perf_counter() - start), "error": error}
+
+
+def federated_search(query, tags, k=5, filter=None):
+    """Search several collections in parallel and merge their top-k by relevance score (0-1, higher is better).
+    The query is embedded once; FAISS releases the GIL while searching, so shards run concurrently on the pool.
+    Returns ([(Document, score)], [per-shard stats]), with chunks found in several collections listed once."""
+    tags = list(dict.fromkeys(tags))
+    if not tags:
+        return [], []
+    query_vector = embeddings.embed_query(query)
+    with ThreadPoolExecutor(max_workers=max(1, min(SEARCH_MAX_WORKERS, len(tags)))) as executor:
+        shards = list(executor.map(lambda tag: _search_shard(tag, query_vector, k, filter), tags))
+    merged = sorted((hit for hits, _ in shards for hit in hits), key=lambda hit: hit[1], reverse=True)
+    results = []
+    seen = set()
+    for doc, score in merged:
+        if doc.page_content in seen:
+            continue
+        seen.add(doc.page_content)
+        results.append((doc, score))
+        if len(results) == k:
+            break
+    stats = [shard_stats for _, shard_stats in shards]
+    print(f"Debug: Federated search over {len(tags)} collections returned {len(results)} chunks; "
+          f"slowest shard {max(s['ms'] for s in stats):.1f} ms.")
+    return results, stats
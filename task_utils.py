@@ -0,0 +1,183 @@
+# task_utils.py
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime
+from config import TASK_WORKERS, TASK_RESOURCE_LIMITS
+from utils import get_connection
+
+# Collection and ingestion jobs are queued in crawled.db and run by a fixed pool of workers, so they survive page
+# reloads and restarts. Source modules register a handler per task type, like models in resource_utils.
+_handlers = {}
+_resources_in_use = defaultdict(int)
+_running = {}
+_condition = threading.Condition()
+_workers = []
+POLL_SECONDS = 5  # Workers also re-check the queue this often, e.g. for tasks queued by another process
+
+
+class TaskContext:
+    """Handed to a running task's handler: report progress and poll for cancellation."""
+
+    def __init__(self, task_id):
+        self.id = task_id
+        self._cancel = threading.Event()
+
+    def progress(self, message):
+        _update_task(self.id, message=message)
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+
+def register_task_type(kind, handler, resources=()):
+    """
+    handler(task, **params) runs one task and returns {"tag", "message", "urls"}. resources are the
+    TASK_RESOURCE_LIMITS keys the task holds while it runs; "ollama" is added when params["use_ollama"] is set.
+    """
+    _handlers[kind] = (handler, list(resources))
+
+
+def _update_task(task_id, **fields):
+    conn = get_connection()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    conn.execute(f"UPDATE tasks SET {assignments} WHERE id = ?", list(fields.values()) + [task_id])
+    conn.commit()
+
+
+def submit_task(kind, name, params, priority=0):
+    if kind not in _handlers:
+        raise ValueError(f"Unknown task type '{kind}'. Registered: {sorted(_handlers)}")
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("INSERT INTO tasks (type, name, params, priority, status, message, created) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+              (kind, name, json.dumps(params), int(priority), "Waiting for a worker.", datetime.now().isoformat()))
+    conn.commit()
+    print(f"Debug: Queued {kind} task {c.lastrowid} ({name}) at priority {priority}.")
+    with _condition:
+        _condition.notify_all()
+    return c.lastrowid
+
+
+def _task_resources(kind, params):
+    resources = list(_handlers[kind][1])
+    if params.get("use_ollama"):
+        resources.append("ollama")
+    return resources
+
+
+def _claim_next():
+    # Called with _condition held. Highest priority first; a task whose resources are all taken is passed over
+    # for the next one that can run now, and retried when a running task releases them.
+    conn = get_connection()
+    for task_id, kind, params in conn.execute("SELECT id, type, params FROM tasks WHERE status = 'queued' "
+                                              "ORDER BY priority DESC, id").fetchall():
+        if kind not in _handlers:
+            _update_task(task_id, status="error", message=f"Unknown task type '{kind}'.", finished=datetime.now().isoformat())
+            continue
+        params = json.loads(params)
+        resources = _task_resources(kind, params)
+        if all(_resources_in_use[r] < TASK_RESOURCE_LIMITS.get(r, TASK_WORKERS) for r in resources):
+            for r in resources:
+                _resources_in_use[r] += 1
+            _update_task(task_id, status="running", message="Started.", started=datetime.now().isoformat())
+            task = TaskContext(task_id)
+            _running[task_id] = task
+            return task, kind, params, resources
+    return None
+
+
+def _worker():
+    while True:
+        with _condition:
+            claimed = _claim_next()
+            while claimed is None:
+                _condition.wait(POLL_SECONDS)
+                claimed = _claim_next()
+        task, kind, params, resources = claimed
+        print(f"Debug: Running {kind} task {task.id} holding {resources or 'no resources'}.")
+        fields = {}
+        try:
+            result = _handlers[kind][0](task, **params)
+            fields = {"status": "completed", "message": result.get("message"), "tag": result.get("tag"),
+                      "result": json.dumps({"urls": result.get("urls", [])})}
+            if task.cancelled():
+                fields.update(status="cancelled", message=f"Cancelled. {result.get('message') or ''}".strip())
+        except Exception as e:
+            fields = {"status": "cancelled" if task.cancelled() else "error", "message": str(e)}
+            print(f"Debug: {kind} task {task.id} error: {e}")
+        finally:
+            fields["finished"] = datetime.now().isoformat()
+            _update_task(task.id, **fields)
+            with _condition:
+                for r in resources:
+                    _resources_in_use[r] -= 1
+                _running.pop(task.id, None)
+                _condition.notify_all()
+        print(f"Debug: {kind} task {task.id} {fields['status']}.")
+
+
+def start_scheduler():
+    """Requeue tasks a previous run left unfinished and start the worker pool (once per process)."""
+    with _condition:
+        if _workers:
+            return
+        conn = get_connection()
+        resumed = conn.execute("UPDATE tasks SET status = 'queued', message = 'Resumed after restart.' "
+                               "WHERE status = 'running' AND cancel_requested = 0").rowcount
+        conn.execute("UPDATE tasks SET status = 'cancelled', message = 'Cancelled.', finished = ? "
+                     "WHERE status = 'running'", (datetime.now().isoformat(),))
+        conn.commit()
+        for i in range(TASK_WORKERS):
+            thread = threading.Thread(target=_worker, name=f"task-worker-{i}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+    print(f"Debug: Task scheduler started with {TASK_WORKERS} workers; {resumed} interrupted tasks requeued.")
+
+
+def cancel_task(task_id):
+    """Cancel a queued task outright; ask a running one to stop after the items it is working on."""
+    with _condition:
+        conn = get_connection()
+        cancelled = conn.execute("UPDATE tasks SET status = 'cancelled', message = 'Cancelled before it started.', "
+                                 "finished = ? WHERE id = ? AND status = 'queued'",
+                                 (datetime.now().isoformat(), task_id)).rowcount
+        conn.commit()
+        if cancelled:
+            return f"Task {task_id} cancelled."
+        if task_id in _running:
+            _update_task(task_id, cancel_requested=1)
+            _running[task_id]._cancel.set()
+            return f"Cancellation of task {task_id} requested; it stops after its current items."
+    return f"Task {task_id} is not queued or running."
+
+
+def set_task_priority(task_id, priority):
+    conn = get_connection()
+    updated = conn.execute("UPDATE tasks SET priority = ? WHERE id = ? AND status = 'queued'", (int(priority), task_id)).rowcount
+    conn.commit()
+    if not updated:
+        return f"Task {task_id} is not queued."
+    with _condition:
+        _condition.notify_all()
+    return f"Task {task_id} priority set to {int(priority)}."
+
+
+def list_tasks(limit=200):
+    c = get_connection().cursor()
+    c.execute("SELECT id, type, name, priority, status, message, tag, created, started, finished FROM tasks "
+              "ORDER BY id DESC LIMIT ?", (limit,))
+    columns = [d[0] for d in c.description]
+    return [dict(zip(columns, row)) for row in c.fetchall()]
+
+
+def get_task(task_id):
+    c = get_connection().cursor()
+    c.execute("SELECT id, type, name, params, status, message, tag, result FROM tasks WHERE id = ?", (task_id,))
+    row = c.fetchone()
+    if row is None:
+        return None
+    task = dict(zip([d[0] for d in c.description], row))
+    task["params"] = json.loads(task["params"])
+    task["result"] = json.loads(task["result"]) if task["result"] else {}
+    return task
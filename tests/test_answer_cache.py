@@ -0,0 +1,55 @@
+# tests/test_answer_cache.py
+# Answers are cached under the collection version seen before retrieval. Run with: python -m pytest tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+import cache_utils
+from cache_utils import lookup_answer, store_answer
+from db_utils import migrate_db, _bump_collection_version
+from utils import connect_db
+
+
+class FixedEmbeddings:
+    def embed_query(self, text):
+        return np.ones(4, dtype=np.float32)
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_utils, "embeddings", FixedEmbeddings())
+    conn = connect_db(str(tmp_path / "crawled.db"))
+    migrate_db(conn)
+    yield conn
+    conn.close()
+
+
+def _bump(conn, tag):
+    _bump_collection_version(conn.cursor(), tag)
+    conn.commit()
+
+
+def test_answer_is_served_on_the_version_it_was_generated_for(conn):
+    _bump(conn, "docs")
+    cached, version = lookup_answer(conn, "docs", "What is FAISS?")
+    assert cached is None and version == 1
+    store_answer(conn, "docs", version, "What is FAISS?", "A vector index.", ["https://example.com"])
+
+    cached, version = lookup_answer(conn, "docs", "what is faiss")
+    assert cached == ("A vector index.", ["https://example.com"])
+    assert version == 1
+
+
+def test_answer_generated_while_collection_changed_is_never_served(conn):
+    _bump(conn, "docs")
+    cached, version = lookup_answer(conn, "docs", "What is FAISS?")
+    # New chunks are indexed while the answer is being generated from the old retrieval
+    _bump(conn, "docs")
+    store_answer(conn, "docs", version, "What is FAISS?", "A stale answer.", [])
+
+    cached, version = lookup_answer(conn, "docs", "What is FAISS?")
+    assert cached is None
+    assert version == 2
@@ -0,0 +1,57 @@
+# tests/test_augment_concurrency.py
+# Concurrent augmentation calls share one AUGMENT_MAX_WORKERS bound on Ollama requests and report per-chunk
+# progress. Run with: python -m pytest tests
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import augment_utils
+from config import AUGMENT_MAX_WORKERS
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+
+    def json(self):
+        return {"response": f"augmented: {self.prompt}"}
+
+
+def test_concurrent_callers_share_the_request_bound(monkeypatch):
+    stored = {}
+    monkeypatch.setattr(augment_utils, "_load_cached", lambda keys: {})
+    monkeypatch.setattr(augment_utils, "_store_cached", lambda key, model, response: stored.__setitem__(key, response))
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def post(url, json, timeout):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return FakeResponse(json["prompt"])
+
+    monkeypatch.setattr(augment_utils.requests, "post", post)
+    messages = [[] for _ in range(6)]
+
+    def augment(document):
+        chunks = [f"document {document} chunk {i}" for i in range(8)]
+        augment_utils.augment_chunks(chunks, template="{chunk}", progress=messages[document].append)
+
+    threads = [threading.Thread(target=augment, args=(document,)) for document in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert in_flight[1] <= AUGMENT_MAX_WORKERS
+    assert len(stored) == 48
+    assert all(document_messages[-1] == "Augmented 8/8 chunks with Ollama" and len(document_messages) == 8
+               for document_messages in messages)
@@ -0,0 +1,48 @@
+# tests/test_db_batching.py
+# Lookups and writes over more values than one 500-parameter batch. Run with: python -m pytest tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from db_utils import (migrate_db, store_content, get_url_freshness, get_stored_contents, add_chunks_if_new,
+                      remove_chunk_tags, _chunked_in_query)
+from utils import connect_db
+
+COUNT = 1203
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect_db(str(tmp_path / "crawled.db"))
+    migrate_db(conn)
+    yield conn
+    conn.close()
+
+
+def test_chunked_in_query_binds_params_before_each_batch(conn):
+    conn.executemany("INSERT INTO urls (url, timestamp, cleaned_text) VALUES (?, ?, ?)",
+                     [(f"u{i}", "2026-01-01", "even" if i % 2 == 0 else "odd") for i in range(COUNT)])
+    rows = _chunked_in_query(conn, "SELECT url FROM urls WHERE cleaned_text = ? AND url IN ({placeholders})",
+                             [f"u{i}" for i in range(COUNT)] + ["missing"], params=("even",))
+    assert sorted(url for url, in rows) == sorted(f"u{i}" for i in range(0, COUNT, 2))
+
+
+def test_url_lookups_span_batches(conn):
+    urls = [f"https://example.com/{i}" for i in range(COUNT)]
+    for url in urls:
+        store_content(conn, url, f"text of {url}")
+
+    assert get_stored_contents(conn, urls + urls[:10]) == {url: f"text of {url}" for url in urls}
+    freshness = get_url_freshness(conn, urls + ["https://example.com/unseen"])
+    assert set(freshness) == set(urls)
+
+
+def test_chunk_membership_spans_batches(conn):
+    items = [(f"chunk {i}", "https://example.com", "docs", None) for i in range(COUNT)]
+    assert add_chunks_if_new(conn, items) == [True] * COUNT
+    assert add_chunks_if_new(conn, items) == [False] * COUNT
+
+    remove_chunk_tags(conn, "docs", [content for content, _, _, _ in items[:700]])
+    assert add_chunks_if_new(conn, items) == [True] * 700 + [False] * (COUNT - 700)
@@ -0,0 +1,114 @@
+# tests/test_driver_pool.py
+# DriverPool lending, max-uses recycling and crash recycling, with Chrome replaced by a stub driver.
+# Run with: python -m pytest tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+pytest.importorskip("selenium")
+pytest.importorskip("webdriver_manager")
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+import browser_utils
+from browser_utils import DriverPool
+
+
+class StubDriver:
+    def __init__(self):
+        self.crashed = False
+        self.quit_calls = 0
+
+    @property
+    def current_url(self):
+        if self.crashed:
+            raise WebDriverException("chrome not reachable")
+        return "about:blank"
+
+    def quit(self):
+        self.quit_calls += 1
+
+
+@pytest.fixture
+def created(monkeypatch):
+    drivers = []
+
+    def chrome(service=None, options=None):
+        drivers.append(StubDriver())
+        return drivers[-1]
+
+    monkeypatch.setattr(browser_utils, "_get_driver_path", lambda: "chromedriver")
+    monkeypatch.setattr(browser_utils, "ChromeService", lambda path: None)
+    monkeypatch.setattr(browser_utils.webdriver, "Chrome", chrome)
+    return drivers
+
+
+def _pool(max_uses=50, size=1):
+    return DriverPool(size=size, headless=True, max_uses=max_uses, cookies_file=None)
+
+
+def test_driver_is_reused_until_max_uses(created):
+    pool = _pool(max_uses=2)
+    lent = []
+    for _ in range(5):
+        with pool.driver() as driver:
+            lent.append(driver)
+
+    assert len(created) == 3
+    assert lent == [created[0], created[0], created[1], created[1], created[2]]
+    assert created[0].quit_calls == 1 and created[1].quit_calls == 1
+    assert created[2].quit_calls == 0
+
+
+def test_driver_crashing_in_use_is_recycled(created):
+    pool = _pool()
+    with pytest.raises(WebDriverException):
+        with pool.driver() as driver:
+            driver.crashed = True
+            raise WebDriverException("tab crashed")
+    with pool.driver() as driver:
+        assert driver is created[1]
+
+    assert created[0].quit_calls == 1
+    assert len(created) == 2
+
+
+def test_driver_errors_without_crash_keep_the_driver(created):
+    pool = _pool()
+    with pytest.raises(TimeoutException):
+        with pool.driver():
+            raise TimeoutException("element not found")
+    with pytest.raises(WebDriverException):
+        with pool.driver():
+            raise WebDriverException("stale element")
+    with pool.driver() as driver:
+        assert driver is created[0]
+
+    assert len(created) == 1
+    assert created[0].quit_calls == 0
+
+
+def test_idle_driver_that_died_is_replaced_on_checkout(created):
+    pool = _pool()
+    with pool.driver() as driver:
+        pass
+    driver.crashed = True
+    with pool.driver() as replacement:
+        assert replacement is created[1]
+
+    assert created[0].quit_calls == 1
+
+
+def test_close_quits_idle_drivers_and_refuses_new_loans(created):
+    pool = _pool(size=2)
+    with pool.driver():
+        with pool.driver():
+            pass
+    pool.close()
+
+    assert [driver.quit_calls for driver in created] == [1, 1]
+    with pytest.raises(RuntimeError):
+        with pool.driver():
+            pass
@@ -0,0 +1,112 @@
+# tests/test_embedding_cache.py
+# CachedEmbeddings caches queries only, as float32 arrays, with a size-limited disk tier; chunk embedding concurrency
+# is bounded across callers. Run with: python -m pytest tests
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import vectorstore_manager
+from config import EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_WORKERS
+from resource_utils import register_resource
+from vectorstore_manager import CachedEmbeddings
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.queries = []
+        self.documents = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text)), 1.0, 0.5]
+
+    def embed_documents(self, texts):
+        self.documents.extend(texts)
+        return [[float(len(text)), 0.0, 0.0] for text in texts]
+
+
+def _cached(tmp_path, name, max_entries=100, max_disk_entries=100):
+    embedder = CountingEmbedder()
+    register_resource(name, lambda: embedder)
+    cache = CachedEmbeddings(name, "test", max_entries=max_entries, disk_path=str(tmp_path / "cache.db"),
+                             max_disk_entries=max_disk_entries)
+    return cache, embedder
+
+
+def test_queries_are_cached_as_float32_arrays(tmp_path):
+    cache, embedder = _cached(tmp_path, "test-embedder-queries")
+    first = cache.embed_query("what is faiss")
+    second = cache.embed_query("what is faiss")
+
+    assert embedder.queries == ["what is faiss"]
+    assert isinstance(first, np.ndarray) and first.dtype == np.float32
+    assert all(isinstance(vector, np.ndarray) and vector.dtype == np.float32 for vector in cache._memory.values())
+    np.testing.assert_array_equal(first, second)
+
+    # A fresh process still finds it on disk
+    reopened = CachedEmbeddings("test-embedder-queries", "test", disk_path=str(tmp_path / "cache.db"))
+    np.testing.assert_array_equal(reopened.embed_query("what is faiss"), first)
+    assert embedder.queries == ["what is faiss"]
+
+
+def test_documents_bypass_the_cache(tmp_path):
+    cache, embedder = _cached(tmp_path, "test-embedder-documents")
+    cache.embed_documents(["chunk one", "chunk two"])
+    cache.embed_documents(["chunk one"])
+
+    assert embedder.documents == ["chunk one", "chunk two", "chunk one"]
+    assert len(cache._memory) == 0
+    assert cache._disk.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0] == 0
+
+
+def test_disk_tier_keeps_the_newest_entries(tmp_path):
+    cache, embedder = _cached(tmp_path, "test-embedder-pruning", max_entries=2, max_disk_entries=3)
+    for i in range(5):
+        cache.embed_query(f"question {i}")
+
+    keys = {key for key, in cache._disk.execute("SELECT key FROM embedding_cache")}
+    assert keys == {cache._key("query", f"question {i}") for i in (2, 3, 4)}
+    assert list(cache._memory) == [cache._key("query", f"question {i}") for i in (3, 4)]
+
+    # Oldest entries are gone from both tiers and are embedded again
+    cache.embed_query("question 0")
+    assert embedder.queries.count("question 0") == 2
+
+
+def test_batched_embedding_concurrency_is_shared_across_callers(monkeypatch):
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    class SlowEmbedder:
+        def embed_documents(self, texts):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return [[float(len(text))] for text in texts]
+
+    class Wrapper:
+        underlying = SlowEmbedder()
+
+    monkeypatch.setattr(vectorstore_manager, "embeddings", Wrapper())
+    results = {}
+
+    def embed(caller):
+        texts = [f"caller {caller} chunk {i}" for i in range(3 * EMBEDDING_BATCH_SIZE)]
+        results[caller] = vectorstore_manager.embed_texts_batched(texts)
+
+    threads = [threading.Thread(target=embed, args=(caller,)) for caller in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert in_flight[1] <= EMBEDDING_MAX_WORKERS
+    assert all(results[caller][0] == [float(len(f"caller {caller} chunk 0"))] for caller in range(6))
+    assert all(len(vectors) == 3 * EMBEDDING_BATCH_SIZE for vectors in results.values())
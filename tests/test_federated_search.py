@@ -0,0 +1,57 @@
+# tests/test_federated_search.py
+# A failing shard doesn't fail the search, and relevance scores stay within 0-1. Run with: python -m pytest tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+import search_utils
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from vectorstore_manager import CachedFAISS
+
+
+class FixedEmbeddings:
+    def embed_query(self, text):
+        return np.zeros(4, dtype=np.float32)
+
+
+def _store(vectors, texts=None):
+    texts = texts or [f"chunk {i}" for i in range(len(vectors))]
+    vs = CachedFAISS(None, faiss.IndexFlatL2(4), InMemoryDocstore(), {})
+    vs.add_embeddings(list(zip(texts, vectors)), ids=[f"id-{text}" for text in texts])
+    return vs
+
+
+def test_failing_shard_is_reported_and_others_answer(monkeypatch):
+    near = _store([np.full(4, 0.1, dtype=np.float32)])
+
+    def get_vectorstore(tag):
+        if tag == "broken":
+            raise RuntimeError("Error in faiss::read_index: unexpected EOF")
+        return near
+
+    monkeypatch.setattr(search_utils, "get_vectorstore", get_vectorstore)
+    monkeypatch.setattr(search_utils, "embeddings", FixedEmbeddings())
+    results, stats = search_utils.federated_search("query", ["broken", "near"], k=3)
+
+    assert [doc.page_content for doc, _ in results] == ["chunk 0"]
+    assert stats[0]["tag"] == "broken" and "unexpected EOF" in stats[0]["error"]
+    assert stats[1]["error"] is None
+
+
+def test_distant_hits_keep_their_distance_order_across_shards(monkeypatch):
+    # Every hit is past the distance where 1 - d/sqrt(2) goes negative; interleave them across two shards
+    values = {"first": (2.0, 4.0, 6.0), "second": (1.0, 3.0, 5.0)}
+    shards = {tag: _store([np.full(4, v, dtype=np.float32) for v in vs], [f"{tag} {v}" for v in vs])
+              for tag, vs in values.items()}
+    monkeypatch.setattr(search_utils, "get_vectorstore", lambda tag: shards[tag])
+    monkeypatch.setattr(search_utils, "embeddings", FixedEmbeddings())
+    results, _ = search_utils.federated_search("query", ["first", "second"], k=5)
+
+    assert [doc.page_content for doc, _ in results] == ["second 1.0", "first 2.0", "second 3.0", "first 4.0", "second 5.0"]
+    scores = [score for _, score in results]
+    assert all(0.0 < score <= 1.0 for score in scores)
+    # Squared L2 distance of (v, v, v, v) from the origin is 4 v^2
+    np.testing.assert_allclose(scores, [1.0 / (1.0 + 4 * v * v) for v in (1.0, 2.0, 3.0, 4.0, 5.0)], rtol=1e-5)
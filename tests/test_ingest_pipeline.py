@@ -0,0 +1,69 @@
+# tests/test_ingest_pipeline.py
+# Fetch-stage handling of revalidated (304) items, with storage and embedding stubbed out.
+# Run with: python -m pytest tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+ingest_pipeline = pytest.importorskip("ingest_pipeline")
+from ingest_pipeline import IngestSource, run_ingestion
+
+URL = "https://example.com/page"
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    state = {"stored": {}, "revalidated": [], "indexed": []}
+    monkeypatch.setattr(ingest_pipeline, "get_connection", lambda: None)
+    monkeypatch.setattr(ingest_pipeline, "get_url_freshness", lambda conn, keys: {key: {"fresh": False, "etag": '"v1"'} for key in keys})
+    monkeypatch.setattr(ingest_pipeline, "get_stored_contents", lambda conn, keys: {k: state["stored"][k] for k in keys if k in state["stored"]})
+    monkeypatch.setattr(ingest_pipeline, "mark_revalidated", lambda conn, key, etag, last_modified: state["revalidated"].append(key))
+    monkeypatch.setattr(ingest_pipeline, "store_content", lambda conn, key, text, etag=None, last_modified=None: state["stored"].__setitem__(key, text))
+    monkeypatch.setattr(ingest_pipeline, "write_raw_files", lambda name, text, use_ollama, title: None)
+    monkeypatch.setattr(ingest_pipeline, "add_chunks_if_new", lambda conn, items: [True] * len(items))
+    monkeypatch.setattr(ingest_pipeline, "embed_texts_batched", lambda texts: [[0.0] for _ in texts])
+    monkeypatch.setattr(ingest_pipeline, "add_documents_to_vectorstore",
+                        lambda tag, docs, vectors=None: state["indexed"].extend(doc.page_content for doc in docs))
+    return state
+
+
+def test_not_modified_uses_stored_copy(storage):
+    storage["stored"][URL] = "stored page text"
+    source = IngestSource("web", [URL], lambda url, etag, last_modified: (None, etag, last_modified))
+    result = run_ingestion("docs", source)
+
+    assert result["contents"] == {URL: "stored page text"} and result["failed"] == []
+    assert storage["revalidated"] == [URL]
+    assert storage["indexed"] == ["stored page text"]
+
+
+def test_not_modified_without_stored_copy_is_refetched(storage):
+    calls = []
+
+    def fetch(url, etag, last_modified):
+        calls.append(etag)
+        return (None, etag, last_modified) if etag else ("fresh page text", '"v2"', None)
+
+    result = run_ingestion("docs", IngestSource("web", [URL], fetch))
+
+    assert calls == ['"v1"', None]
+    assert result["contents"] == {URL: "fresh page text"} and result["failed"] == []
+    assert storage["stored"][URL] == "fresh page text" and storage["revalidated"] == []
+
+
+def test_revalidation_error_is_reported_as_failed_item(storage, monkeypatch):
+    storage["stored"][URL] = "stored page text"
+
+    def broken(conn, key, etag, last_modified):
+        raise OSError("database is locked")
+
+    monkeypatch.setattr(ingest_pipeline, "mark_revalidated", broken)
+    messages = []
+    result = run_ingestion("docs", IngestSource("web", [URL], lambda url, etag, last_modified: (None, etag, last_modified)),
+                           progress=messages.append)
+
+    assert result["failed"] == [URL] and result["contents"] == {}
+    assert messages == [f"Fetched and cleaned 1/1: {URL} (failed)"]
@@ -0,0 +1,63 @@
+# tests/test_transcript_scrape.py
+# _scrape_transcript against a local page mimicking YouTube's transcript panel, in a real headless Chrome.
+# Skipped when selenium or a Chrome/chromedriver pair is unavailable. Run with: python -m pytest tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+webdriver = pytest.importorskip("selenium.webdriver")
+# youtube_utils pulls in yt_dlp, youtube_transcript_api and the other ingestion dependencies
+youtube_utils = pytest.importorskip("youtube_utils")
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "transcript_panel.html")
+
+
+@pytest.fixture(scope="module")
+def driver():
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless=new')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    try:
+        driver = webdriver.Chrome(options=options)
+    except Exception as e:
+        pytest.skip(f"No headless Chrome available: {e}")
+    yield driver
+    driver.quit()
+
+
+def _run(generator):
+    # Drain a status-yielding fetcher; returns (statuses, return value)
+    statuses = []
+    while True:
+        try:
+            statuses.append(next(generator))
+        except StopIteration as stop:
+            return statuses, stop.value
+
+
+def test_scrape_transcript_reads_panel_segments(driver, monkeypatch):
+    monkeypatch.setattr(youtube_utils, "BROWSER_WAIT_TIMEOUT", 3)
+    statuses, text = _run(youtube_utils._scrape_transcript(driver, "file://" + FIXTURE))
+
+    assert text == "Welcome back to the channel.\nToday we look at vector indexes.\nThanks for watching."
+    messages = [message for _, message in statuses]
+    assert "Step 2/8: No consent popup found or already handled." in messages
+    assert "Step 3/8 completed: Description expanded." in messages
+    assert "Step 4/8 completed: 'Show transcript' clicked." in messages
+    assert "Step 6/8 completed: Extracted 3 lines of transcript." in messages
+
+
+def test_scrape_transcript_without_transcript_button_returns_none(driver, monkeypatch, tmp_path):
+    monkeypatch.setattr(youtube_utils, "BROWSER_WAIT_TIMEOUT", 1)
+    with open(FIXTURE, encoding="utf-8") as f:
+        page = f.read().replace("<ytd-video-description-transcript-section-renderer>", "<div>")
+    (tmp_path / "no_transcript.html").write_text(page, encoding="utf-8")
+
+    statuses, text = _run(youtube_utils._scrape_transcript(driver, (tmp_path / "no_transcript.html").as_uri()))
+
+    assert text is None
+    assert statuses[-1][1].startswith("Error: Could not find 'Show transcript'")
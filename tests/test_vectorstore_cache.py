@@ -0,0 +1,94 @@
+# tests/test_vectorstore_cache.py
+# get_vectorstore loads a collection from disk outside the cache lock, once per tag. Run with: python -m pytest tests
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import vectorstore_manager
+
+
+class StubStore:
+    cache_bytes = 0
+
+
+@pytest.fixture
+def slow_loads(monkeypatch):
+    """Replace disk loads with stubs; loads of tags in `blocked` wait until the test releases them."""
+    monkeypatch.setattr(vectorstore_manager, "_cache", vectorstore_manager.OrderedDict())
+    monkeypatch.setattr(vectorstore_manager, "_loading", {})
+    monkeypatch.setattr(vectorstore_manager, "schedule_index_rebuild", lambda tag, vs: False)
+    state = {"loads": [], "release": threading.Event(), "started": threading.Event(), "blocked": set(), "fail": set()}
+
+    def load(tag):
+        state["loads"].append(tag)
+        if tag in state["blocked"]:
+            state["started"].set()
+            assert state["release"].wait(5)
+        if tag in state["fail"]:
+            raise ValueError(f"corrupt collection {tag}")
+        return StubStore()
+
+    monkeypatch.setattr(vectorstore_manager, "_load_vectorstore", load)
+    return state
+
+
+def _in_thread(fn, *args):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("value", fn(*args)), daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_slow_load_does_not_block_cached_collections(slow_loads):
+    cached = vectorstore_manager.get_vectorstore("cached")
+    slow_loads["blocked"].add("slow")
+    thread, _ = _in_thread(vectorstore_manager.get_vectorstore, "slow")
+    assert slow_loads["started"].wait(5)
+
+    # Served while "slow" is still loading
+    done, result = _in_thread(vectorstore_manager.get_vectorstore, "cached")
+    done.join(2)
+    assert result.get("value") is cached
+
+    slow_loads["release"].set()
+    thread.join(5)
+    assert list(vectorstore_manager._cache) == ["cached", "slow"]
+
+
+def test_concurrent_callers_share_one_load(slow_loads):
+    slow_loads["blocked"].add("shared")
+    threads = [_in_thread(vectorstore_manager.get_vectorstore, "shared") for _ in range(4)]
+    assert slow_loads["started"].wait(5)
+    slow_loads["release"].set()
+    for thread, _ in threads:
+        thread.join(5)
+
+    assert slow_loads["loads"] == ["shared"]
+    assert len({id(result["value"]) for _, result in threads}) == 1
+    assert vectorstore_manager._loading == {}
+
+
+def test_failed_load_is_not_cached_and_is_retried(slow_loads):
+    slow_loads["fail"].add("broken")
+    with pytest.raises(ValueError):
+        vectorstore_manager.get_vectorstore("broken")
+    assert "broken" not in vectorstore_manager._cache and vectorstore_manager._loading == {}
+
+    slow_loads["fail"].clear()
+    assert vectorstore_manager.get_vectorstore("broken") is vectorstore_manager._cache["broken"]
+    assert slow_loads["loads"] == ["broken", "broken"]
+
+
+def test_collection_evicted_while_loading_is_not_published(slow_loads):
+    slow_loads["blocked"].add("stale")
+    thread, result = _in_thread(vectorstore_manager.get_vectorstore, "stale")
+    assert slow_loads["started"].wait(5)
+    vectorstore_manager.evict_vectorstore("stale")
+    slow_loads["release"].set()
+    thread.join(5)
+
+    assert isinstance(result["value"], StubStore)
+    assert "stale" not in vectorstore_manager._cache
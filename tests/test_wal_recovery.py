@@ -0,0 +1,161 @@
+# tests/test_wal_recovery.py
+# Crash recovery of the per-collection append log (wal.vec + wal.jsonl) and of snapshot compaction.
+# Run with: python -m pytest tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+import vectorstore_manager
+from vectorstore_manager import (CachedFAISS, _append_wal, _replay_wal, _compact, _open_saved_vectorstore,
+                                 _remove_stale_files, read_collection_meta, COLLECTION_META_FILE,
+                                 WAL_ENTRIES_FILE, WAL_VECTORS_FILE)
+
+D = 8
+
+
+def _vector(text):
+    # Deterministic, distinct vector per text
+    rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+    return rng.normal(size=D).astype(np.float32)
+
+
+def _empty_store():
+    return CachedFAISS(None, faiss.IndexFlatL2(D), InMemoryDocstore(), {})
+
+
+def _append(path, texts):
+    _append_wal(path, [f"id-{t}" for t in texts], texts, [{"text": t} for t in texts], [_vector(t) for t in texts])
+
+
+def _assert_aligned(vs, texts):
+    assert vs.index.ntotal == len(texts)
+    stored = vs.index.reconstruct_n(0, vs.index.ntotal)
+    for i, doc_id in vs.index_to_docstore_id.items():
+        text = vs.docstore.search(doc_id).page_content
+        assert doc_id == f"id-{text}"
+        np.testing.assert_allclose(stored[i], _vector(text))
+    assert sorted(vs.docstore.search(doc_id).page_content for doc_id in vs.index_to_docstore_id.values()) == sorted(texts)
+
+
+def test_orphan_vectors_are_dropped_before_next_append(tmp_path):
+    path = str(tmp_path)
+    first = [f"chunk a {i}" for i in range(8)]
+    _append(path, first)
+    # Crash after the vector fsync but before the entry lines were written
+    with open(os.path.join(path, WAL_VECTORS_FILE), "ab") as f:
+        f.write(np.stack([_vector("lost 1"), _vector("lost 2")]).tobytes())
+
+    assert _replay_wal(path, _empty_store()) == 8
+    second = [f"chunk a {i}" for i in range(8, 11)]
+    _append(path, second)
+
+    vs = _empty_store()
+    assert _replay_wal(path, vs) == 11
+    _assert_aligned(vs, first + second)
+    found = vs.similarity_search_with_score_by_vector(_vector("chunk a 8").tolist(), k=1)[0][0]
+    assert found.page_content == "chunk a 8"
+
+
+def test_torn_entry_line_is_dropped_before_next_append(tmp_path):
+    path = str(tmp_path)
+    first = ["one", "two", "three"]
+    _append(path, first)
+    # Crash mid-way through writing the entries of the next append: its vector is on disk, its line is torn
+    with open(os.path.join(path, WAL_VECTORS_FILE), "ab") as f:
+        f.write(_vector("four").tobytes())
+    with open(os.path.join(path, WAL_ENTRIES_FILE), "a", encoding="utf-8") as f:
+        f.write('{"id": "id-four", "te')
+
+    assert _replay_wal(path, _empty_store()) == 3
+    _append(path, ["five", "six"])
+
+    vs = _empty_store()
+    assert _replay_wal(path, vs) == 5
+    _assert_aligned(vs, first + ["five", "six"])
+
+
+def test_unterminated_but_parseable_line_is_treated_as_torn(tmp_path):
+    path = str(tmp_path)
+    _append(path, ["one"])
+    with open(os.path.join(path, WAL_VECTORS_FILE), "ab") as f:
+        f.write(_vector("two").tobytes())
+    with open(os.path.join(path, WAL_ENTRIES_FILE), "a", encoding="utf-8") as f:
+        f.write('{"id": "id-two", "text": "two", "metadata": {}}')
+
+    assert _replay_wal(path, _empty_store()) == 1
+    _append(path, ["three"])
+    vs = _empty_store()
+    assert _replay_wal(path, vs) == 2
+    _assert_aligned(vs, ["one", "three"])
+
+
+def _saved_collection(path, texts):
+    # A generation-0 collection: empty snapshot in the directory, texts in its log
+    vs = _empty_store()
+    vs.save_local(path)
+    _append(path, texts)
+    _replay_wal(path, vs)
+    vs.wal_entries = len(texts)
+    return vs
+
+
+def _reload(path):
+    vs = _open_saved_vectorstore(None, path)
+    _remove_stale_files(path, vs.generation)
+    assert _replay_wal(path, vs, vs.generation) >= 0
+    return vs
+
+
+def test_compaction_commits_a_new_generation(tmp_path):
+    path = str(tmp_path)
+    vs = _saved_collection(path, ["one", "two"])
+    _compact(path, vs)
+
+    assert vs.generation == 1 and read_collection_meta(path)["generation"] == 1
+    assert sorted(os.listdir(path)) == [COLLECTION_META_FILE, "snapshot.1"]
+    _append_wal(path, ["id-three"], ["three"], [{"text": "three"}], [_vector("three")], generation=vs.generation)
+
+    _assert_aligned(_reload(path), ["one", "two", "three"])
+
+
+def test_crash_before_commit_keeps_old_snapshot_and_log(tmp_path, monkeypatch):
+    path = str(tmp_path)
+    vs = _saved_collection(path, ["one", "two"])
+
+    def crash(*args, **kwargs):
+        raise OSError("power lost")
+
+    monkeypatch.setattr(vectorstore_manager, "write_collection_meta", crash)
+    with pytest.raises(OSError):
+        _compact(path, vs)
+    monkeypatch.undo()
+
+    reloaded = _reload(path)
+    assert reloaded.generation == 0
+    assert not os.path.exists(os.path.join(path, "snapshot.1"))
+    _assert_aligned(reloaded, ["one", "two"])
+
+
+def test_crash_after_commit_does_not_replay_folded_log(tmp_path, monkeypatch):
+    path = str(tmp_path)
+    vs = _saved_collection(path, ["one", "two"])
+
+    def crash(*args, **kwargs):
+        raise OSError("power lost")
+
+    monkeypatch.setattr(vectorstore_manager, "_remove_stale_files", crash)
+    with pytest.raises(OSError):
+        _compact(path, vs)
+    monkeypatch.undo()
+    # The old log is still on disk, next to the new snapshot that already contains it
+    assert os.path.getsize(os.path.join(path, WAL_VECTORS_FILE)) > 0
+
+    reloaded = _reload(path)
+    assert reloaded.generation == 1
+    _assert_aligned(reloaded, ["one", "two"])
+    assert sorted(os.listdir(path)) == [COLLECTION_META_FILE, "snapshot.1"]
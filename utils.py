@@ -1,3 +1,113 @@
+import hashlib
+import sqlite3
 import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from config import DB_PATH, LOCK_WAIT_WARN_SECONDS
 
-lock = threading.Lock()
\ No newline at end of file
+def hash_chunk(content):
+    # Chunk identity shared by the chunks table and the docstore ids of sqlite-backed collections
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def connect_db(db_path=DB_PATH):
+    """
+    Open a new connection to crawled.db (or db_path) in WAL mode, so readers never wait on a writer and writers
+    wait on each other inside SQLite (busy_timeout) instead of on a Python lock. Each task owns its connection; it is not
+    bound to the creating thread because Gradio may resume a generator on a different worker thread.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+_thread_local = threading.local()
+
+def get_connection():
+    # One long-lived connection per thread for short callbacks and retrievers
+    conn = getattr(_thread_local, "conn", None)
+    if conn is None:
+        conn = connect_db()
+        _thread_local.conn = conn
+    return conn
+
+# Lock-wait instrumentation: name -> {"count", "total_wait_s", "max_wait_s"}
+_lock_wait_stats = defaultdict(lambda: {"count": 0, "total_wait_s": 0.0, "max_wait_s": 0.0})
+_lock_wait_stats_lock = threading.Lock()
+
+def _record_lock_wait(name, waited):
+    with _lock_wait_stats_lock:
+        stats = _lock_wait_stats[name]
+        stats["count"] += 1
+        stats["total_wait_s"] += waited
+        stats["max_wait_s"] = max(stats["max_wait_s"], waited)
+    if waited >= LOCK_WAIT_WARN_SECONDS:
+        print(f"Debug: Waited {waited:.2f}s for lock '{name}'.")
+
+def get_lock_wait_stats():
+    with _lock_wait_stats_lock:
+        return {name: dict(stats) for name, stats in _lock_wait_stats.items()}
+
+class RWLock:
+    """
+    Reader/writer lock: any number of concurrent readers or a single writer. Waiting writers block new readers so
+    ingestion can't be starved by chat traffic. The writing thread may re-enter write() and read().
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        if self._writer == threading.get_ident():
+            yield
+            return
+        start = time.perf_counter()
+        with self._cond:
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        _record_lock_wait(f"{self.name}:read", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            yield
+            return
+        start = time.perf_counter()
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+        _record_lock_wait(f"{self.name}:write", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = None
+                self._cond.notify_all()
+
+_collection_locks = {}
+_collection_locks_lock = threading.Lock()
+
+def get_collection_lock(tag):
+    # Keyed by tag rather than by loaded store, so an evicted and reloaded collection still shares one lock
+    with _collection_locks_lock:
+        if tag not in _collection_locks:
+            _collection_locks[tag] = RWLock(f"collection:{tag}")
+        return _collection_locks[tag]
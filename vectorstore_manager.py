@@ -1,31 +1,609 @@
 # vectorstore_manager.py
 import os
-from config import FAISS_PATH
+import json
+import hashlib
+import sqlite3
+import shutil
+import uuid
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import FAISS_PATH, VECTORSTORE_CACHE_MAX_MB
+from config import EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_DEVICE, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_WORKERS
 from langchain_ollama import OllamaEmbeddings
 from langchain_community.vectorstores import FAISS
-from config import MODEL_NAME
+from config import MODEL_NAME, WAL_COMPACT_MIN_ENTRIES, WAL_COMPACT_RATIO, DOCSTORE_BACKEND, VECTORSTORE_MMAP
+from config import EMBEDDING_CACHE_SIZE, EMBEDDING_DISK_CACHE, EMBEDDING_DISK_CACHE_MAX_ENTRIES
+from langchain_core.embeddings import Embeddings
+from docstore_utils import SQLiteDocstore
+from utils import hash_chunk, RWLock, get_collection_lock
+from resource_utils import register_resource, get_resource
+from ann_utils import build_adaptive_index, candidate_types, index_kind, index_vectors, bytes_per_vector
+import faiss
+import numpy as np
 
-embeddings = OllamaEmbeddings(model=MODEL_NAME)
+COLLECTION_META_FILE = "collection.json"
+# Append-only log next to the index.faiss/index.pkl snapshot: raw float32 vectors plus one JSON docstore entry per line
+WAL_VECTORS_FILE = "wal.vec"
+WAL_ENTRIES_FILE = "wal.jsonl"
+# Each compaction writes a complete snapshot into snapshot.<generation>/ and starts wal.<generation>.vec/.jsonl, then
+# commits both by atomically replacing collection.json with the new generation. Generation 0 is the original layout:
+# snapshot files and log directly in the collection directory.
+SNAPSHOT_DIR = "snapshot"
+# Snapshot of sqlite-backed collections: index.faiss plus the docstore ids (chunk hashes) in index order
+SQLITE_IDS_FILE = "ids.json"
+# Collections saved before the embedder was recorded were all built with the chat model through Ollama
+LEGACY_EMBEDDER = {"backend": "ollama", "model": MODEL_NAME}
 
-def get_vectorstore(tag=None):
-    if tag is None:
-        # Return an empty vectorstore if no tag
-        vs = FAISS.from_texts(["dummy"], embeddings)  # Dummy
-        vs.delete([vs.index_to_docstore_id[0]])  # Remove dummy
-        print(f"Debug: Created empty vectorstore (no tag provided). ntotal: {vs.index.ntotal}")
+
+def _build_embeddings():
+    if EMBEDDING_BACKEND == "huggingface":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL,
+            model_kwargs={"device": EMBEDDING_DEVICE},
+            encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE, "normalize_embeddings": True},
+        )
+    if EMBEDDING_BACKEND == "ollama":
+        return OllamaEmbeddings(model=EMBEDDING_MODEL)
+    raise ValueError(f"Unsupported EMBEDDING_BACKEND '{EMBEDDING_BACKEND}'. Use 'huggingface' or 'ollama'.")
+
+
+class CachedEmbeddings(Embeddings):
+    """Memoizing wrapper for query embeddings: a bounded in-memory LRU of float32 vectors in front of an optional,
+    size-limited SQLite tier, keyed by embedder and text. Documents go straight to the underlying embedder; ingestion
+    never embeds a chunk twice (dedupe), so caching them would only grow the cache. The embedder itself is a
+    registered resource, so it is only loaded when a text misses both cache tiers."""
+
+    def __init__(self, resource_name, namespace, max_entries=EMBEDDING_CACHE_SIZE, disk_path=EMBEDDING_DISK_CACHE,
+                 max_disk_entries=EMBEDDING_DISK_CACHE_MAX_ENTRIES):
+        self.resource_name = resource_name
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("CREATE TABLE IF NOT EXISTS embedding_cache (key TEXT PRIMARY KEY, vector BLOB)")
+            # Also trims caches written before the limit existed, when chunks were cached too
+            self._prune_disk()
+            self._disk.commit()
+
+    @property
+    def underlying(self):
+        return get_resource(self.resource_name)
+
+    def _key(self, kind, text):
+        return hashlib.sha256(f"{self.namespace}\0{kind}\0{text}".encode()).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            if self._disk is None:
+                return None
+            row = self._disk.execute("SELECT vector FROM embedding_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            self._remember(key, vector)
+            return vector
+
+    def _prune_disk(self):
+        # Oldest first: INSERT OR REPLACE gives a re-stored key a new rowid
+        excess = self._disk.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0] - self.max_disk_entries
+        if excess > 0:
+            self._disk.execute("DELETE FROM embedding_cache WHERE rowid IN "
+                               "(SELECT rowid FROM embedding_cache ORDER BY rowid LIMIT ?)", (excess,))
+            print(f"Debug: Pruned {excess} oldest entries from the embedding disk cache.")
+
+    def _store(self, key, vector):
+        with self._lock:
+            self._remember(key, vector)
+            if self._disk is not None:
+                self._disk.execute("INSERT OR REPLACE INTO embedding_cache (key, vector) VALUES (?, ?)",
+                                   (key, vector.tobytes()))
+                self._prune_disk()
+                self._disk.commit()
+
+    def embed_documents(self, texts):
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = self._key("query", text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = np.asarray(self.underlying.embed_query(text), dtype=np.float32)
+            self._store(key, vector)
+        return vector
+
+
+register_resource("embeddings", _build_embeddings)
+embeddings = CachedEmbeddings("embeddings", f"{EMBEDDING_BACKEND}:{EMBEDDING_MODEL}")
+_embedding_dimension = None
+# One pool for every embed_texts_batched caller, so concurrent ingestions share the EMBEDDING_MAX_WORKERS bound
+_embedding_executor = ThreadPoolExecutor(max_workers=max(1, EMBEDDING_MAX_WORKERS), thread_name_prefix="embed")
+
+# Process-wide registry of loaded collections, least recently used first.
+_cache = OrderedDict()
+_cache_lock = threading.RLock()
+# Collections being read from disk: tag -> Future of the loaded vectorstore, shared by concurrent callers
+_loading = {}
+_empty_vectorstore = None
+# Background index rebuilds in progress, by tag
+_rebuilds = {}
+_rebuilds_lock = threading.Lock()
+
+
+class CachedFAISS(FAISS):
+    """FAISS store shared through the registry. Searches take the collection's read lock and run concurrently;
+    index writes take its write lock so readers never observe a half-applied add. Embedding happens outside the lock."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Replaced with the per-tag lock once the store is bound to a collection
+        self.lock = RWLock("collection:unbound")
+        self.cache_bytes = 0
+        self.wal_entries = 0
+        self.generation = 0
+        self.mmapped = False
+
+    def similarity_search_with_score_by_vector(self, *args, **kwargs):
+        with self.lock.read():
+            return super().similarity_search_with_score_by_vector(*args, **kwargs)
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        text_embeddings = self._embed_documents(texts)
+        return self.add_embeddings(zip(texts, text_embeddings), metadatas=metadatas, ids=ids, **kwargs)
+
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        text_embeddings = list(text_embeddings)
+        with self.lock.write():
+            if self.mmapped:
+                # Memory-mapped vectors are read-only; take a private in-memory copy before the first write
+                self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+                self.mmapped = False
+            added = super().add_embeddings(text_embeddings, metadatas=metadatas, ids=ids, **kwargs)
+            self.cache_bytes += _vector_bytes(self, len(text_embeddings))
+            if not isinstance(self.docstore, SQLiteDocstore):
+                self.cache_bytes += sum(len(text) for text, _ in text_embeddings)
+        return added
+
+    def delete(self, ids=None, **kwargs):
+        with self.lock.write():
+            return super().delete(ids=ids, **kwargs)
+
+    def save_local(self, folder_path, index_name="index"):
+        # Snapshotting only reads the index, but must not interleave with an add
+        with self.lock.write():
+            if not isinstance(self.docstore, SQLiteDocstore):
+                super().save_local(folder_path, index_name=index_name)
+                return
+            os.makedirs(folder_path, exist_ok=True)
+            faiss.write_index(self.index, os.path.join(folder_path, f"{index_name}.faiss"))
+            ids = [self.index_to_docstore_id[i] for i in range(len(self.index_to_docstore_id))]
+            with open(os.path.join(folder_path, SQLITE_IDS_FILE), "w", encoding="utf-8") as f:
+                json.dump(ids, f)
+
+
+def _vector_bytes(vs, count):
+    return count * bytes_per_vector(vs.index)
+
+
+def _estimate_bytes(vs):
+    text_bytes = sum(len(doc.page_content) for doc in getattr(vs.docstore, "_dict", {}).values())
+    return _vector_bytes(vs, vs.index.ntotal) + text_bytes
+
+
+def get_embedding_dimension():
+    global _embedding_dimension
+    if _embedding_dimension is None:
+        _embedding_dimension = len(embeddings.embed_query("dimension probe"))
+    return _embedding_dimension
+
+
+def current_embedder():
+    return {"backend": EMBEDDING_BACKEND, "model": EMBEDDING_MODEL, "dimension": get_embedding_dimension()}
+
+
+def read_collection_meta(path):
+    meta_path = os.path.join(path, COLLECTION_META_FILE)
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_collection_meta(path, **updates):
+    """Atomically replace collection.json: readers and crash recovery see either the old or the new version."""
+    meta = read_collection_meta(path)
+    meta.update(updates)
+    meta_path = os.path.join(path, COLLECTION_META_FILE)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def _generation(path):
+    return read_collection_meta(path).get("generation", 0)
+
+
+def _snapshot_path(path, generation):
+    return path if generation == 0 else os.path.join(path, f"{SNAPSHOT_DIR}.{generation}")
+
+
+def _wal_path(path, name, generation):
+    if generation == 0:
+        return os.path.join(path, name)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(path, f"{stem}.{generation}{ext}")
+
+
+def collection_index_path(path):
+    """The index.faiss of the collection's current snapshot."""
+    return os.path.join(_snapshot_path(path, _generation(path)), "index.faiss")
+
+
+def _remove_stale_files(path, generation):
+    # Snapshots and logs of other generations: folded into the current one, or left by a compaction that crashed
+    # before committing. Caller holds the collection's write lock.
+    current = {os.path.basename(_snapshot_path(path, generation)), os.path.basename(_wal_path(path, WAL_VECTORS_FILE, generation)),
+               os.path.basename(_wal_path(path, WAL_ENTRIES_FILE, generation))}
+    for name in os.listdir(path):
+        stale = name.startswith(SNAPSHOT_DIR + ".") or (name.startswith("wal.") and name.endswith((".vec", ".jsonl")))
+        if generation > 0 and name in ("index.faiss", "index.pkl", SQLITE_IDS_FILE):
+            stale = True
+        if stale and name not in current:
+            target = os.path.join(path, name)
+            shutil.rmtree(target) if os.path.isdir(target) else os.remove(target)
+            print(f"Debug: Removed stale snapshot file {target}.")
+
+
+def _fsync_tree(path):
+    for name in os.listdir(path):
+        with open(os.path.join(path, name), "rb") as f:
+            os.fsync(f.fileno())
+
+
+def _check_embedder(tag, path, vs):
+    recorded = read_collection_meta(path).get("embedder") or dict(LEGACY_EMBEDDER, dimension=vs.index.d)
+    expected = current_embedder()
+    if (recorded["backend"], recorded["model"], recorded["dimension"]) != (expected["backend"], expected["model"], expected["dimension"]):
+        raise ValueError(
+            f"Collection '{tag}' was built with {recorded['backend']}:{recorded['model']} ({recorded['dimension']} dims) "
+            f"but the configured embedder is {expected['backend']}:{expected['model']} ({expected['dimension']} dims). "
+            f"Run 'python reembed.py \"{tag}\"' to migrate it."
+        )
+
+
+def _new_empty_vectorstore(docstore=None):
+    vs = CachedFAISS.from_texts(["dummy"], embeddings)  # Dummy
+    vs.delete([vs.index_to_docstore_id[0]])  # Remove dummy
+    if docstore is not None:
+        vs.docstore = docstore
+    return vs
+
+
+def _open_saved_vectorstore(tag, path):
+    """Load a collection's current snapshot (without replaying its log) in the docstore format it was saved with."""
+    meta = read_collection_meta(path)
+    generation = meta.get("generation", 0)
+    snapshot = _snapshot_path(path, generation)
+    if meta.get("docstore") != "sqlite":
+        vs = CachedFAISS.load_local(snapshot, embeddings, allow_dangerous_deserialization=True)
+        vs.generation = generation
         return vs
+    io_flags = 0
+    if VECTORSTORE_MMAP:
+        io_flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    index = faiss.read_index(os.path.join(snapshot, "index.faiss"), io_flags)
+    with open(os.path.join(snapshot, SQLITE_IDS_FILE), "r", encoding="utf-8") as f:
+        ids = json.load(f)
+    vs = CachedFAISS(embeddings, index, SQLiteDocstore(tag), dict(enumerate(ids)))
+    vs.generation = generation
+    vs.mmapped = VECTORSTORE_MMAP
+    return vs
+
+
+def _load_vectorstore(tag):
+    # Hold the collection's write lock so a writer still using an evicted instance can't append mid-load
+    with get_collection_lock(tag).write():
+        vs = _load_vectorstore_locked(tag)
+    vs.lock = get_collection_lock(tag)
+    return vs
+
+
+def _load_vectorstore_locked(tag):
     path = os.path.join(FAISS_PATH, tag)
     if not os.path.exists(path):
         os.makedirs(path)
         print(f"Debug: Created new directory for vectorstore tag '{tag}' at {path}.")
-    index_path = os.path.join(path, "index.faiss")
+    index_path = collection_index_path(path)
     if os.path.exists(index_path):
-        vs = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
-        print(f"Debug: Loaded existing vectorstore for tag '{tag}' from {index_path}. ntotal: {vs.index.ntotal}")
-        return vs
+        vs = _open_saved_vectorstore(tag, path)
+        _check_embedder(tag, path, vs)
+        _remove_stale_files(path, vs.generation)
+        vs.wal_entries = _replay_wal(path, vs, vs.generation)
+        print(f"Debug: Loaded existing vectorstore for tag '{tag}' from {index_path} "
+              f"(replayed {vs.wal_entries} logged chunks). ntotal: {vs.index.ntotal}")
     else:
-        vs = FAISS.from_texts(["dummy"], embeddings)  # Dummy
-        vs.delete([vs.index_to_docstore_id[0]])  # Remove dummy
+        vs = _new_empty_vectorstore(SQLiteDocstore(tag) if DOCSTORE_BACKEND == "sqlite" else None)
         vs.save_local(path)
+        write_collection_meta(path, embedder=current_embedder(), docstore=DOCSTORE_BACKEND)
         print(f"Debug: Created and saved new empty vectorstore for tag '{tag}' at {path}. ntotal: {vs.index.ntotal}")
-        return vs
\ No newline at end of file
+    vs.cache_bytes = _estimate_bytes(vs)
+    return vs
+
+
+def _replay_wal(path, vs, generation=None):
+    """Apply the log of the snapshot's generation (entries written since that snapshot), skipping entries already
+    in it. Entry i pairs with vector i, so anything past the last complete pair -- a torn entry line, or vectors
+    whose entries were never written -- is cut off both files before the next append can misalign them.
+    Caller holds the collection's write lock."""
+    if generation is None:
+        generation = _generation(path)
+    entries_path = _wal_path(path, WAL_ENTRIES_FILE, generation)
+    vectors_path = _wal_path(path, WAL_VECTORS_FILE, generation)
+    if not os.path.exists(entries_path) or not os.path.exists(vectors_path):
+        return 0
+    vectors = np.fromfile(vectors_path, dtype=np.float32)
+    vectors = vectors[:len(vectors) - len(vectors) % vs.index.d].reshape(-1, vs.index.d)
+    entries = []
+    entry_ends = [0]
+    with open(entries_path, "rb") as f:
+        for line in f:
+            # A line without its newline is torn even if it happens to parse
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+            entry_ends.append(entry_ends[-1] + len(line))
+    count = min(len(entries), len(vectors))
+    for file_path, size in ((entries_path, entry_ends[count]), (vectors_path, count * vs.index.d * 4)):
+        if os.path.getsize(file_path) > size:
+            print(f"Debug: Truncating inconsistent log tail of {file_path} from {os.path.getsize(file_path)} to {size} bytes.")
+            os.truncate(file_path, size)
+    known_ids = set(vs.index_to_docstore_id.values())
+    pending = [(entries[i], vectors[i]) for i in range(count) if entries[i]["id"] not in known_ids]
+    if pending:
+        vs.add_embeddings([(entry["text"], vector.tolist()) for entry, vector in pending],
+                          metadatas=[entry["metadata"] for entry, _ in pending],
+                          ids=[entry["id"] for entry, _ in pending])
+    return count
+
+
+def _append_wal(path, ids, texts, metadatas, vectors, store_text=True, generation=None):
+    if generation is None:
+        generation = _generation(path)
+    # Vectors first: an entry line is only trusted once its vector is on disk
+    with open(_wal_path(path, WAL_VECTORS_FILE, generation), "ab") as f:
+        f.write(np.asarray(vectors, dtype=np.float32).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    with open(_wal_path(path, WAL_ENTRIES_FILE, generation), "a", encoding="utf-8") as f:
+        for doc_id, text, metadata in zip(ids, texts, metadatas):
+            f.write(json.dumps({"id": doc_id, "text": text if store_text else "", "metadata": metadata}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _compact(path, vs):
+    """Fold the log into a fresh snapshot of the next generation, committed by one atomic rewrite of collection.json:
+    a crash at any point leaves either the old snapshot with its log or the new one with an empty log.
+    Caller holds the write lock so no append can land in the old log after the snapshot is taken."""
+    generation = vs.generation + 1
+    snapshot = _snapshot_path(path, generation)
+    if os.path.exists(snapshot):
+        shutil.rmtree(snapshot)
+    vs.save_local(snapshot)
+    _fsync_tree(snapshot)
+    write_collection_meta(path, generation=generation)
+    vs.generation = generation
+    _remove_stale_files(path, generation)
+    print(f"Debug: Compacted {vs.wal_entries} logged chunks into snapshot {snapshot}. ntotal: {vs.index.ntotal}")
+    vs.wal_entries = 0
+
+
+def _evict_over_budget():
+    budget = VECTORSTORE_CACHE_MAX_MB * 1024 * 1024
+    total = sum(vs.cache_bytes for vs in _cache.values())
+    # Always keep the most recently used collection, even if it alone exceeds the budget
+    while total > budget and len(_cache) > 1:
+        tag, vs = _cache.popitem(last=False)
+        total -= vs.cache_bytes
+        print(f"Debug: Evicted vectorstore for tag '{tag}' from cache ({vs.cache_bytes} bytes).")
+
+
+def get_vectorstore(tag=None):
+    global _empty_vectorstore
+    with _cache_lock:
+        if tag is None:
+            # Return an empty vectorstore if no tag
+            if _empty_vectorstore is None:
+                _empty_vectorstore = _new_empty_vectorstore()
+                print(f"Debug: Created empty vectorstore (no tag provided). ntotal: {_empty_vectorstore.index.ntotal}")
+            return _empty_vectorstore
+        vs = _cache.get(tag)
+        if vs is not None:
+            _cache.move_to_end(tag)
+            return vs
+        future = _loading.get(tag)
+        loader = future is None
+        if loader:
+            future = _loading[tag] = Future()
+    if not loader:
+        return future.result()
+    # Load without _cache_lock, so a slow disk load doesn't stall lookups of other collections
+    try:
+        vs = _load_vectorstore(tag)
+    except Exception as e:
+        with _cache_lock:
+            if _loading.get(tag) is future:
+                del _loading[tag]
+        future.set_exception(e)
+        raise
+    with _cache_lock:
+        # Only publish if the collection wasn't evicted (deleted, re-embedded) while it loaded
+        if _loading.get(tag) is future:
+            del _loading[tag]
+            _cache[tag] = vs
+            _evict_over_budget()
+    future.set_result(vs)
+    schedule_index_rebuild(tag, vs)
+    return vs
+
+
+def embed_texts_batched(texts):
+    """Embed texts in EMBEDDING_BATCH_SIZE batches with at most EMBEDDING_MAX_WORKERS requests in flight across
+    all callers. Returns vectors in input order."""
+    if not texts:
+        return []
+    batches = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+    # Chunks bypass the embedding cache
+    embed = embeddings.underlying.embed_documents
+    results = list(_embedding_executor.map(embed, batches))
+    print(f"Debug: Embedded {len(texts)} texts in {len(batches)} batches.")
+    return [vector for batch in results for vector in batch]
+
+
+def add_documents_to_vectorstore(tag, docs, vectors=None):
+    """Embed documents in batches (unless their vectors are given) and add them to the cached collection in one
+    bulk write, so readers pick them up without a reload. Persistence appends only the new chunks to the collection's log; the full snapshot is
+    rewritten only when the log grows past WAL_COMPACT_RATIO of it."""
+    vs = get_vectorstore(tag)
+    texts = [doc.page_content for doc in docs]
+    metadatas = [doc.metadata for doc in docs]
+    lazy_docstore = isinstance(vs.docstore, SQLiteDocstore)
+    # Lazily loaded collections look chunks up in crawled.db by hash, so the hash is the docstore id
+    ids = [hash_chunk(text) if lazy_docstore else str(uuid.uuid4()) for text in texts]
+    if vectors is None:
+        vectors = embed_texts_batched(texts)
+    save_path = os.path.join(FAISS_PATH, tag)
+    with vs.lock.write():
+        vs.add_embeddings(zip(texts, vectors), metadatas=metadatas, ids=ids)
+        print(f"Debug: Added {len(docs)} documents to vectorstore for tag {tag}. ntotal after add: {vs.index.ntotal}")
+        _append_wal(save_path, ids, texts, metadatas, vectors, store_text=not lazy_docstore, generation=vs.generation)
+        vs.wal_entries += len(docs)
+        print(f"Debug: Appended {len(docs)} chunks to log for tag {tag} ({vs.wal_entries} since last snapshot).")
+        snapshot_entries = vs.index.ntotal - vs.wal_entries
+        if vs.wal_entries >= max(WAL_COMPACT_MIN_ENTRIES, WAL_COMPACT_RATIO * snapshot_entries):
+            _compact(save_path, vs)
+    with _cache_lock:
+        if tag in _cache:
+            _evict_over_budget()
+    schedule_index_rebuild(tag, vs)
+    return vs
+
+
+def schedule_index_rebuild(tag, vs):
+    """Start a background rebuild if the collection has outgrown (or been configured away from) its index type.
+    Returns True if a rebuild was started."""
+    if vs.index.ntotal == 0 or index_kind(vs.index) in candidate_types(vs.index.ntotal):
+        return False
+    with _rebuilds_lock:
+        if tag in _rebuilds:
+            return False
+        thread = threading.Thread(target=_rebuild_index, args=(tag, vs), name=f"index-rebuild:{tag}", daemon=True)
+        _rebuilds[tag] = thread
+    thread.start()
+    return True
+
+
+def _rebuild_index(tag, vs):
+    """Train and fill the new index from a copy of the vectors while searches and adds continue on the old one,
+    then catch up on vectors added meanwhile and swap it in under the write lock."""
+    try:
+        old_kind = index_kind(vs.index)
+        with vs.lock.write():
+            count = vs.index.ntotal
+            vectors = index_vectors(vs.index)
+            metric = vs.index.metric_type
+        print(f"Debug: Rebuilding {old_kind} index of tag '{tag}' ({count} vectors) in the background...")
+        start = time.perf_counter()
+        index, kind, tuning = build_adaptive_index(vectors, metric)
+        with vs.lock.write():
+            # A plain read is enough here: a dict lookup is atomic
+            if _cache.get(tag) is not vs or vs.index.ntotal < count:
+                print(f"Debug: Collection '{tag}' was reloaded, deleted or shrunk during its index rebuild. Discarding it.")
+                return
+            if vs.index.ntotal > count:
+                index.add(index_vectors(vs.index, count))
+            vs.index = index
+            vs.mmapped = False
+            path = os.path.join(FAISS_PATH, tag)
+            _compact(path, vs)
+            write_collection_meta(path, index={"type": kind, "recall": tuning["recall"], "param": tuning["param"],
+                                               "value": tuning["value"], "built_vectors": count})
+            vs.cache_bytes = _estimate_bytes(vs)
+        print(f"Debug: Index of tag '{tag}' rebuilt as {kind} in {time.perf_counter() - start:.1f}s "
+              f"(recall@10 {tuning['recall']:.3f}, {tuning['param']}={tuning['value']}).")
+    except Exception as e:
+        print(f"Debug: Background index rebuild for tag '{tag}' failed: {e}")
+    finally:
+        with _rebuilds_lock:
+            _rebuilds.pop(tag, None)
+
+
+def evict_vectorstore(tag):
+    with _cache_lock:
+        _loading.pop(tag, None)
+        if _cache.pop(tag, None) is not None:
+            print(f"Debug: Dropped cached vectorstore for tag '{tag}'.")
+
+
+def reembed_collection(tag):
+    """Rebuild a collection's index with the configured embedder, keeping its documents and ids.
+    Returns False if the collection already matches the configured embedder."""
+    path = os.path.join(FAISS_PATH, tag)
+    if not os.path.exists(collection_index_path(path)):
+        raise ValueError(f"No saved index found for collection '{tag}' at {path}.")
+    # Only the documents are reused; the stored vectors are discarded
+    old_vs = _open_saved_vectorstore(tag, path)
+    _replay_wal(path, old_vs)
+    recorded = read_collection_meta(path).get("embedder") or dict(LEGACY_EMBEDDER, dimension=old_vs.index.d)
+    if recorded == current_embedder():
+        print(f"Debug: Collection '{tag}' already uses the configured embedder. Skipping.")
+        return False
+    ids = [old_vs.index_to_docstore_id[i] for i in range(len(old_vs.index_to_docstore_id))]
+    docs = [old_vs.docstore.search(doc_id) for doc_id in ids]
+    texts = [doc.page_content for doc in docs]
+    print(f"Debug: Re-embedding {len(texts)} chunks of collection '{tag}' with {EMBEDDING_BACKEND}:{EMBEDDING_MODEL}...")
+    if texts:
+        vectors = embed_texts_batched(texts)
+        new_vs = CachedFAISS.from_embeddings(list(zip(texts, vectors)), embeddings,
+                                             metadatas=[doc.metadata for doc in docs], ids=ids)
+    else:
+        new_vs = _new_empty_vectorstore()
+    if isinstance(old_vs.docstore, SQLiteDocstore):
+        new_vs.docstore = SQLiteDocstore(tag)
+    # Write next to the old index and swap directories so a failure never leaves a half-written collection
+    tmp_path = path + ".reembed"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    new_vs.save_local(tmp_path)
+    # The new collection starts over at generation 0, with its snapshot directly in the directory and no log
+    write_collection_meta(tmp_path, **dict(read_collection_meta(path), embedder=current_embedder(), generation=0))
+    with get_collection_lock(tag).write():
+        backup_path = path + ".old"
+        os.replace(path, backup_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(backup_path)
+    evict_vectorstore(tag)
+    print(f"Debug: Collection '{tag}' re-embedded: {recorded['model']} ({recorded['dimension']} dims) -> "
+          f"{EMBEDDING_MODEL} ({get_embedding_dimension()} dims).")
+    return True
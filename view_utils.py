@@ -1,24 +1,22 @@
 # view_utils.py
 import os
 import pandas as pd
-from utils import lock
+from utils import get_connection, get_lock_wait_stats
 from vectorstore_manager import get_vectorstore
+from search_utils import federated_search
+from ingest_pipeline import recent_ingestion_stats
+from task_utils import list_tasks, get_task
 from langchain_ollama import OllamaLLM
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
-from db_utils import get_stored_content
+from db_utils import get_stored_contents, get_unique_tags, get_collections
 from config import MODEL_NAME
-import sqlite3
-from sqlalchemy import create_engine
-import faissqlite  # Assume installed; if not, comment out and use basic FAISS
-from langchain_ollama import OllamaEmbeddings
 
 def view_db(conn):
     print("Viewing database...")
-    with lock:
-        df_urls = pd.read_sql("SELECT * FROM urls", conn)
-        df_chunks = pd.read_sql("SELECT * FROM chunks", conn)
+    df_urls = pd.read_sql("SELECT * FROM urls", conn)
+    df_chunks = pd.read_sql("SELECT * FROM tagged_chunks", conn)
     print("Database viewed.")
     return df_urls, df_chunks
 
@@ -31,10 +29,9 @@ def execute_sql_query(conn, sql_query):
 
 def view_vectorstore():
     print("Viewing vectorstore...")
-    with lock:
-        if get_vectorstore().index.ntotal == 0:
-            return "No content in vectorstore."
-        docs = get_vectorstore().similarity_search(" ", k=get_vectorstore().index.ntotal)
+    if get_vectorstore().index.ntotal == 0:
+        return "No content in vectorstore."
+    docs = get_vectorstore().similarity_search(" ", k=get_vectorstore().index.ntotal)
     out = ""
     seen_sources = set()
     for doc in docs:
@@ -47,29 +44,34 @@ def view_vectorstore():
     return out
 
 def perform_similarity_search(query_text):
-    embeddings = OllamaEmbeddings(model=MODEL_NAME)  # Assume same as project
-    query_emb = embeddings.embed_query(query_text)
-    distances, indices = get_vectorstore().index.search(query_emb, k=5)
+    tags = [c['tag'] for c in get_collections(get_connection())]
+    hits, shard_stats = federated_search(query_text, tags, k=5)
     results = ""
-    for idx in indices[0]:
-        doc = get_vectorstore().similarity_search_by_index(idx)
-        results += f"Document: {doc.page_content[:200]}... (Score: {distances[0][idx]})\n\n"
-    return results
+    for doc, score in hits:
+        results += f"**{doc.metadata.get('tag', 'Unknown')}** - {doc.metadata.get('source', 'Unknown')}\n"
+        results += f"Document: {doc.page_content[:200]}... (Score: {score:.3f})\n\n"
+    if not results:
+        results = "No matching documents in any collection."
+    shards_df = pd.DataFrame(shard_stats, columns=["tag", "hits", "ms", "error"])
+    shards_df["ms"] = shards_df["ms"].round(1)
+    return results, shards_df
 
-def refresh_tasks(tasks):
+def refresh_tasks():
     print("Refreshing tasks...")
-    return pd.DataFrame(tasks)
+    return pd.DataFrame(list_tasks(), columns=["id", "type", "name", "priority", "status", "message", "tag", "created", "started", "finished"])
 
-def show_task_detail(task_id, tasks, conn):
+def show_task_detail(task_id, conn):
     print(f"Showing detail for task ID: {task_id}")
-    if task_id is None or task_id < 0 or task_id >= len(tasks):
+    task = get_task(int(task_id)) if task_id is not None else None
+    if task is None:
         return "Invalid task ID", "", ""
-    task = tasks[task_id]
-    if 'urls' not in task or 'tag' not in task:
+    urls = task['result'].get('urls')
+    if not urls or not task['tag']:
         return "No details available for this task", "", ""
     content_out = ""
-    for url in task['urls']:
-        cleaned = get_stored_content(conn, url)
+    stored = get_stored_contents(conn, urls)
+    for url in urls:
+        cleaned = stored.get(url)
         if cleaned:
             content_out += f"**{url}**\n{cleaned[:500]}...\n\n"
     
@@ -89,21 +91,36 @@ def show_task_detail(task_id, tasks, conn):
     )
     qa_chain = create_stuff_documents_chain(llm, qa_prompt)
     qa_chain_with_docs = create_retrieval_chain(retriever, qa_chain)
-    qa_response = qa_chain_with_docs.invoke({"input": task['query']})
+    qa_response = qa_chain_with_docs.invoke({"input": task['params'].get('query') or ""})
     answer = qa_response["answer"]
     
     print("Task detail generated.")
     return content_out, summary, answer
 
 def view_available_tags():
-    conn = sqlite3.connect('crawled.db')
-    c = conn.cursor()
-    c.execute("SELECT DISTINCT tag FROM chunks WHERE tag IS NOT NULL")
-    tags = [row[0] for row in c.fetchall()]
-    conn.close()
+    tags = get_unique_tags(get_connection())
     if not tags:
         return "No available data sources (tags) found."
     out = "**Available Data Sources (Tags):**\n"
     for tag in tags:
         out += f"- {tag}\n"
-    return out
\ No newline at end of file
+    return out
+
+def view_lock_stats():
+    stats = get_lock_wait_stats()
+    if not stats:
+        return pd.DataFrame(columns=["lock", "acquisitions", "total_wait_s", "avg_wait_ms", "max_wait_ms"])
+    rows = [{"lock": name, "acquisitions": s["count"], "total_wait_s": round(s["total_wait_s"], 3),
+             "avg_wait_ms": round(1000 * s["total_wait_s"] / s["count"], 2), "max_wait_ms": round(1000 * s["max_wait_s"], 2)}
+            for name, s in sorted(stats.items())]
+    return pd.DataFrame(rows)
+
+def view_ingestion_stats():
+    # One row per stage of each recent ingestion run, newest run first
+    rows = [{"time": run["time"], "tag": run["tag"], "kind": run["kind"], "items": run["items"],
+             "new_chunks": run["new_chunks"], "elapsed_s": round(run["elapsed_s"], 2), "stage": m["stage"],
+             "workers": m["workers"], "in": m["in"], "out": m["out"], "errors": m["errors"], "busy_s": round(m["busy_s"], 2),
+             "idle_s": round(m["idle_s"], 2), "blocked_s": round(m["blocked_s"], 2)}
+            for run in reversed(recent_ingestion_stats) for m in run["stages"]]
+    return pd.DataFrame(rows, columns=["time", "tag", "kind", "items", "new_chunks", "elapsed_s", "stage", "workers",
+                                       "in", "out", "errors", "busy_s", "idle_s", "blocked_s"])
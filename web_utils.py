@@ -1,24 +1,15 @@
 # web_utils.py
 import os
-import spacy
-import requests
-import threading
-import sqlite3
 from ddgs import DDGS
-from bs4 import BeautifulSoup
 import re
-from config import MAX_URLS, FAISS_PATH, RAW_DIR
-from process_utils import process_urls
-from utils import lock
-from vectorstore_manager import get_vectorstore
-from db_utils import add_collection, get_stored_content  # Added get_stored_content
-from urllib.parse import quote
-import html
-import re  # Added for sanitization
+from config import RAW_DIR
+from process_utils import web_source
+from ingest_pipeline import run_ingestion
+from utils import connect_db
+from db_utils import add_collection
 from datetime import datetime  # Added for timestamp in consolidated file
-from augment_utils import augment_chunk  # Import for augmentation
+from task_utils import submit_task, register_task_type
 
-nlp = spacy.load("en_core_web_sm")
 
 def sanitize_tag(name):
     # Replace spaces with '_'
@@ -45,22 +36,9 @@ def search_web(query, site=None, timelimit=None):
     print(f"Debug: Found {len(urls)} URLs: {urls}")
     return urls
 
-def run_web_collection(task_id, custom_name, query, timelimit, max_urls, use_ollama, tasks, completed_collections):
-    print(f"Debug: Starting Web collection task {task_id} for query: {query}")
-    conn = sqlite3.connect('crawled.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS urls
-                 (url TEXT PRIMARY KEY, timestamp DATETIME, cleaned_text TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS chunks
-                 (hash TEXT PRIMARY KEY, content TEXT, source TEXT, tag TEXT)''')
-    try:
-        c.execute("ALTER TABLE chunks ADD COLUMN tag TEXT")
-        print("Debug: Added 'tag' column to chunks table.")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" not in str(e):
-            raise e
-        print("Debug: 'tag' column already exists in chunks table.")
-    conn.commit()
+def run_web_collection(task, custom_name, query, timelimit, max_urls, use_ollama):
+    print(f"Debug: Starting Web collection task {task.id} for query: {query}")
+    conn = connect_db()
     try:
         print("Debug: Mapping timelimit to code...")
         timelimit_code = {'Day': 'd', 'Week': 'w', 'Month': 'm', 'Year': 'y'}.get(timelimit)
@@ -72,17 +50,11 @@ def run_web_collection(task_id, custom_name, query, timelimit, max_urls, use_oll
         tag = sanitize_tag(raw_tag)  # Sanitize to prevent invalid path characters
         print(f"Debug: Sanitized tag from '{raw_tag}' to '{tag}'")
         name = custom_name or f"Web - {query} ({timelimit})"
-        history = [{"role": "assistant", "content": ""}]  # Dummy
-        message = query
-        response = ""
 
         print("Debug: Starting URL processing...")
-        process_gen = process_urls(all_urls, response, history, message, conn=conn, source_tag=tag, use_ollama=use_ollama)
-        try:
-            while True:
-                next(process_gen)
-        except StopIteration as e:
-            sources, response, history = e.value
+        result = run_ingestion(tag, web_source(all_urls, lyrics='lyrics' in query.lower()), use_ollama=use_ollama,
+                               progress=task.progress, cancelled=task.cancelled)
+        contents = result["contents"]
         print("Debug: URL processing completed.")
 
         # Create consolidated file after processing
@@ -93,8 +65,9 @@ def run_web_collection(task_id, custom_name, query, timelimit, max_urls, use_oll
         consolidated_filename = f"{prefix}{tag}-{timestamp_str}.txt"
         consolidated_filepath = os.path.join(RAW_DIR, consolidated_filename)
         consolidated_content = ""
+        # Reuse the text the pipeline already has in hand instead of reading each page back from the database
         for url in all_urls:
-            content = get_stored_content(conn, url)
+            content = contents.get(url)
             if content:
                 consolidated_content += f"Content from {url}:\n{content}\n\n"
             else:
@@ -105,22 +78,14 @@ def run_web_collection(task_id, custom_name, query, timelimit, max_urls, use_oll
 
         add_collection(conn, name, tag)  # Save to DB
 
-        tasks[task_id]['status'] = 'completed'
-        tasks[task_id]['message'] = "Collection completed. New content added to vectorstore if applicable."
-        tasks[task_id]['tag'] = tag
-        completed_collections.append({'name': name, 'tag': tag})
-        print(f"Debug: Web collection task {task_id} completed.")
-    except Exception as e:
-        tasks[task_id]['status'] = 'error'
-        tasks[task_id]['message'] = str(e)
-        print(f"Debug: Web collection task {task_id} error: {e}")
+        print(f"Debug: Web collection task {task.id} completed.")
+        return {"tag": tag, "message": f"Collection completed. {result['new_chunks']} new chunks added.", "urls": all_urls}
     finally:
         conn.close()
 
-def start_web_collection(custom_name, query, timelimit, max_urls=10, use_ollama=False, tasks=None, completed_collections=None):
-    print("Debug: Starting web collection in background.")
-    task_id = len(tasks)
-    task = {'id': task_id, 'type': 'web', 'custom_name': custom_name, 'query': query, 'timelimit': timelimit, 'max_urls': max_urls, 'use_ollama': use_ollama, 'status': 'running', 'message': ''}
-    tasks.append(task)
-    threading.Thread(target=run_web_collection, args=(task_id, custom_name, query, timelimit, max_urls, use_ollama, tasks, completed_collections)).start()
-    return "Web collection started in background.", tasks, completed_collections
\ No newline at end of file
+def start_web_collection(custom_name, query, timelimit, max_urls=10, use_ollama=False, priority=0):
+    params = {'custom_name': custom_name, 'query': query, 'timelimit': timelimit, 'max_urls': int(max_urls), 'use_ollama': use_ollama}
+    task_id = submit_task('web', custom_name or f"Web - {query} ({timelimit})", params, priority)
+    return f"Web collection queued as task {task_id}. Follow it in the Tasks tab."
+
+register_task_type('web', run_web_collection, resources=['http'])